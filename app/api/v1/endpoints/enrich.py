@@ -1,28 +1,47 @@
 import asyncio
 import time
-from fastapi import APIRouter, HTTPException, Request
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
 from app.models.schemas import (
     EnrichmentRequest,
     EnrichmentResponse,
     BatchEnrichmentRequest,
     BatchEnrichmentResponse,
 )
+from app.config import settings
 from app.services.enrichment_service import enrichment_service
 from app.core import logging
+from app.core.admission import admission_controller
 
 router = APIRouter()
 logger = logging.logger
 
+# Validates the raw batch body straight from JSON bytes in pydantic-core
+_BATCH_ADAPTER = TypeAdapter(BatchEnrichmentRequest)
+
+# Request body schema for /docs; nested models point at the copies FastAPI
+# already puts in components/schemas (a local $defs would not resolve there)
+_BATCH_BODY_SCHEMA = BatchEnrichmentRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+_BATCH_BODY_SCHEMA.pop("$defs", None)
+
 # Rate limiting (get limiter from app state if needed, or use global)
 # For simplicity, we can rely on main.py limiter if attached to request state
 # or just import a global limiter if defined in dependencies.
 # Here we'll just use the service.
 
-@router.post("/enrich", response_model=EnrichmentResponse)
+@router.post(
+    "/enrich",
+    # Responses are serialized here so cache hits can skip pydantic entirely
+    response_model=None,
+    responses={200: {"model": EnrichmentResponse}},
+)
 async def enrich_product(
     request: Request,
     enrichment_request: EnrichmentRequest,
-):
+) -> Response:
     """
     Enrich product data using minimal input information.
     
@@ -34,40 +53,113 @@ async def enrich_product(
     try:
         # Rate limiting check could go here if using slowapi decorator
         
-        response = await enrichment_service.enrich_product(enrichment_request)
+        # Cache hit: return the stored JSON bytes as-is
+        raw = await enrichment_service.get_cached_json(enrichment_request)
+        if raw is not None:
+            return Response(content=raw, media_type="application/json", headers={"X-Cache": "HIT"})
+
+        response = await enrichment_service.enrich_product(enrichment_request, check_cache=False)
         
         if not response.success:
             # We return 200 even on logical failure, but with success=False
             # Alternatively, we could raise HTTPException based on error type
-            logger.warning(f"Enrichment failed for {enrichment_request.product_name}: {response.error}")
+            logger.warning("Enrichment failed for %s: %s", enrichment_request.product_name, response.error)
             
-        return response
+        return Response(content=response.model_dump_json(), media_type="application/json", headers={"X-Cache": "MISS"})
         
     except Exception as e:
-        logger.error(f"Unexpected error in enrichment endpoint: {str(e)}", exc_info=True)
+        logger.error("Unexpected error in enrichment endpoint: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error processing enrichment request")
 
 
-@router.post("/enrich/batch", response_model=BatchEnrichmentResponse)
-async def enrich_products_batch(request: Request, batch_request: BatchEnrichmentRequest):
+def _dedupe_key(product: EnrichmentRequest) -> Tuple[str, str, str, str, str]:
+    """Canonical identity of a batch item; equal keys are enriched only once."""
+    return (
+        product.product_name.strip().lower(),
+        (product.brand or "").strip().lower(),
+        (product.model or "").strip().lower(),
+        (product.category or "").strip().lower(),
+        (product.additional_context or "").strip(),
+    )
+
+
+async def _enrich_with_admission(product: EnrichmentRequest) -> EnrichmentResponse:
+    """Run one batch item once the adaptive concurrency limit admits it."""
+    async with admission_controller.slot():
+        t0 = time.monotonic()
+        try:
+            result = await enrichment_service.enrich_product(product)
+        except Exception as e:
+            admission_controller.record(0.0, ok=False, error=e)
+            raise
+        # Cache hits say nothing about pipeline capacity
+        if not result.cached:
+            admission_controller.record(time.monotonic() - t0, ok=result.success)
+        return result
+
+
+@router.post(
+    "/enrich/batch",
+    response_model=BatchEnrichmentResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _BATCH_BODY_SCHEMA}},
+        }
+    },
+)
+async def enrich_products_batch(request: Request):
     """
-    Enrich multiple products in one request. Each product is enriched in parallel
-    (search → scrape → LLM). Returns one result per product plus summary.
+    Enrich multiple products in one request. Products are enriched in parallel
+    (search → scrape → LLM) under an adaptive concurrency limit.
+    Returns one result per product plus summary.
     """
     start_time = time.time()
     try:
-        tasks = [
-            enrichment_service.enrich_product(product)
-            for product in batch_request.products
-        ]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        batch_request = _BATCH_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        )
+
+    try:
+        products = batch_request.products
+
+        # Group duplicate products so each unique one runs the pipeline once
+        groups: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for i, product in enumerate(products):
+            groups[_dedupe_key(product)].append(i)
+        if len(groups) < len(products):
+            logger.info("Batch of %s products has %s unique items", len(products), len(groups))
+
+        unique_products = [products[idxs[0]] for idxs in groups.values()]
+        if settings.BATCH_LLM_GROUP_SIZE > 1:
+            # Similar products share one multi-product LLM call
+            unique_results = await enrichment_service.enrich_products_bulk(unique_products)
+        else:
+            unique_results = await asyncio.gather(
+                *(_enrich_with_admission(product) for product in unique_products),
+                return_exceptions=True,
+            )
+
+        # Fan each unique result back out to every original position
+        results: list = [None] * len(products)
+        for idxs, r in zip(groups.values(), unique_results):
+            for i in idxs:
+                if isinstance(r, BaseException) or i == idxs[0]:
+                    results[i] = r
+                else:
+                    results[i] = r.model_copy(update={"product_name": products[i].product_name}, deep=True)
 
         normalized = []
         for i, r in enumerate(results):
-            if isinstance(r, Exception):
+            # BaseException: a cancelled item comes back as CancelledError
+            if isinstance(r, BaseException):
                 logger.error(
-                    f"Batch item failed for {batch_request.products[i].product_name}: {r}",
-                    exc_info=True,
+                    "Batch item failed for %s: %s",
+                    batch_request.products[i].product_name,
+                    r,
+                    exc_info=r,
                 )
                 normalized.append(
                     EnrichmentResponse(
@@ -79,7 +171,7 @@ async def enrich_products_batch(request: Request, batch_request: BatchEnrichment
             else:
                 normalized.append(r)
                 if not r.success:
-                    logger.warning(f"Enrichment failed for {r.product_name}: {r.error}")
+                    logger.warning("Enrichment failed for %s: %s", r.product_name, r.error)
 
         total = len(normalized)
         succeeded = sum(1 for x in normalized if x.success)
@@ -94,7 +186,7 @@ async def enrich_products_batch(request: Request, batch_request: BatchEnrichment
             total_processing_time=total_processing_time,
         )
     except Exception as e:
-        logger.error(f"Unexpected error in batch enrichment: {str(e)}", exc_info=True)
+        logger.error("Unexpected error in batch enrichment: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail="Internal server error processing batch enrichment request",
@@ -13,6 +13,8 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = "ollama"
     OPENAI_BASE_URL: Optional[str] = "http://localhost:11434/v1"
     OPENAI_MODEL_NAME: str = "llama3"
+    OLLAMA_RPM: int = 120  # Requests per minute sent to the LLM (0 = unlimited)
+    OLLAMA_TPM: int = 600000  # Estimated tokens per minute sent to the LLM (0 = unlimited)
     
     # Search
     SEARCH_PROVIDER: Optional[str] = None # None = LLM only, or "duckduckgo", "serpapi", etc.
@@ -23,8 +25,14 @@ class Settings(BaseSettings):
     BING_SEARCH_API_KEY: Optional[str] = None
     
     # Caching
+    CACHE_ENABLED: bool = True
     REDIS_URL: str = "redis://localhost:6379/0"
     CACHE_TTL_DAYS: int = 7
+    CACHE_ZSTD_DICT_PATH: Optional[str] = None  # Trained zstd dictionary for cached payloads
+    SEMANTIC_CACHE_ENABLED: bool = False  # Reuse LLM output for near-identical product names
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # Minimum cosine similarity for a semantic hit
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 10000
+    EMBEDDING_MODEL_NAME: str = "nomic-embed-text"
     
     # Security & Rate Limiting
     API_RATE_LIMIT: str = "100/hour"
@@ -33,7 +41,35 @@ class Settings(BaseSettings):
     # Processing
     MAX_SEARCH_RESULTS: int = 5
     MAX_TOKENS: int = 4096
+    LLM_RESPONSE_RESERVE_TOKENS: int = 1536  # Part of MAX_TOKENS kept free for the JSON answer
     REQUEST_TIMEOUT: int = 120
+    HOST_RATE_LIMIT: int = 8  # Requests per second to any one host when scraping/searching (0 = unlimited)
+    HTTP_MAX_RETRIES: int = 3  # Retries on 429/503 with exponential backoff
+    WARMUP_HOSTS: List[str] = []  # Sent one HEAD request on startup, e.g. ["html.duckduckgo.com"]
+
+    # Scraping: stop waiting on stragglers once enough content has arrived
+    SCRAPE_MIN_SOURCES: int = 2  # Pages with at least SCRAPE_MIN_CHARS of text
+    SCRAPE_MIN_CHARS: int = 500
+    SCRAPE_DEADLINE_SECONDS: float = 5.0
+    SCRAPE_MAX_CONCURRENCY: int = 32  # Page fetches in flight across all hosts
+    SCRAPE_PER_HOST_CONCURRENCY: int = 4  # Page fetches in flight per host
+    SCRAPE_MAX_BYTES: int = 1048576  # Stop downloading a page after this many bytes
+    # Batch scrapes through rusty-req (opt-in): no page cache or Retry-After
+    # handling, and pages are taken as decoded text regardless of charset
+    SCRAPE_RUSTY_REQ: bool = False
+    SCRAPE_CACHE_DIR: Optional[str] = None  # On-disk page cache revalidated with conditional GETs (needs diskcache)
+    SCRAPE_CACHE_TTL_HOURS: int = 24
+
+    # Batch concurrency (AIMD: additive increase / multiplicative decrease)
+    BATCH_MAX_CONCURRENCY: int = 8
+    LATENCY_TARGET_MS: int = 30000
+    AIMD_ALPHA: float = 0.5
+    AIMD_BETA: float = 0.5
+    BATCH_LLM_GROUP_SIZE: int = 5  # Products per multi-product LLM call (1 = one call per product)
+
+    # Micro-batching: single-product LLM calls arriving within the window share one completion
+    MICROBATCH_WINDOW_MS: int = 50  # 0 = disabled
+    MICROBATCH_MAX_SIZE: int = 5
 
     @validator("CORS_ORIGINS", pre=True)
     def assemble_cors_origins(cls, v: str | List[str]) -> List[str]:
@@ -0,0 +1,84 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+from app.config import settings
+from app.core import logging
+
+logger = logging.logger
+
+class AIMDController:
+    """
+    Adaptive concurrency limit for enrichment pipelines.
+
+    The limit grows additively (+alpha) while the rolling average latency stays
+    within target and shrinks multiplicatively (*beta) on slow responses or
+    errors, so the number of parallel pipelines tracks what Ollama and the
+    search provider can actually sustain.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        latency_target_ms: int,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        min_concurrency: int = 1,
+        window: int = 20,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.latency_target = latency_target_ms / 1000.0
+        self.alpha = alpha
+        self.beta = beta
+        self.limit = float(max(self.min_concurrency, self.max_concurrency // 2))
+        self._latencies = deque(maxlen=window)
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.min_concurrency, int(self.limit))
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait until the current limit admits one more pipeline."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.concurrency)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                # The limit may have grown since waiters last checked it
+                self._cond.notify_all()
+
+    def record(self, latency: float, ok: bool = True, error: Optional[Exception] = None):
+        """Feed one observed outcome back into the limit."""
+        if ok:
+            self._latencies.append(latency)
+            avg_latency = sum(self._latencies) / len(self._latencies)
+            if avg_latency <= self.latency_target:
+                self.limit = min(float(self.max_concurrency), self.limit + self.alpha)
+                return
+        self.backoff(error)
+
+    def backoff(self, error: Optional[Exception] = None):
+        """Multiplicatively shrink the limit (slow responses, errors, throttling)."""
+        previous = self.concurrency
+        self.limit = max(float(self.min_concurrency), self.limit * self.beta)
+        if self.concurrency != previous:
+            logger.info(
+                "Reducing enrichment concurrency %s -> %s (%s)",
+                previous,
+                self.concurrency,
+                error or "latency above target",
+            )
+
+admission_controller = AIMDController(
+    max_concurrency=settings.BATCH_MAX_CONCURRENCY,
+    latency_target_ms=settings.LATENCY_TARGET_MS,
+    alpha=settings.AIMD_ALPHA,
+    beta=settings.AIMD_BETA,
+)
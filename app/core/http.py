@@ -0,0 +1,80 @@
+import importlib.util
+import random
+import ssl
+import certifi
+import httpx
+from app.config import settings
+from app.core.rate_limit import HostRateLimiter
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+]
+
+# Only advertise encodings this install can decode: br needs brotli, zstd
+# needs zstandard (and httpx >= 0.27.1)
+ACCEPT_ENCODING = ", ".join(
+    encoding
+    for encoding, module in (("br", "brotli"), ("zstd", "zstandard"), ("gzip", None))
+    if module is None or importlib.util.find_spec(module) is not None
+)
+
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENTS[0],
+    "Accept-Encoding": ACCEPT_ENCODING,
+}
+
+# rusty-req (reqwest) decodes gzip, brotli and deflate but not zstd
+BATCH_HEADERS = {
+    "User-Agent": USER_AGENTS[0],
+    "Accept-Encoding": "br, gzip",
+}
+
+# Responses worth retrying after a backoff
+RETRY_STATUSES = frozenset({429, 503})
+
+# Shared by the scraper and search services
+host_rate_limiter = HostRateLimiter(settings.HOST_RATE_LIMIT)
+
+def rotated_headers(current: dict) -> dict:
+    """`current` with a different User-Agent from the pool."""
+    choices = [ua for ua in USER_AGENTS if ua != current.get("User-Agent")]
+    return {**current, "User-Agent": random.choice(choices)}
+
+# HTTP/2 needs the optional `h2` package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Built once: loading the CA bundle is expensive. certifi's bundle (httpx's
+# default) rather than the OS store, which slim images may not ship.
+# (TLS sessions are not resumed: CPython only does that when a session is
+# passed explicitly.)
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+def create_http_transport() -> httpx.AsyncHTTPTransport:
+    """
+    Connection pool behind the shared client. `retries=1` re-attempts a
+    failed connect (DNS blip, reset during the TLS handshake) once; HTTP
+    status retries stay with the callers.
+    """
+    return httpx.AsyncHTTPTransport(
+        retries=1,
+        http2=HTTP2_AVAILABLE,
+        verify=SSL_CONTEXT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30),
+    )
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Build the long-lived HTTP client shared by the scraper and search services.
+    Reusing one pool keeps connections alive between requests instead of paying
+    a TCP + TLS handshake for every URL, and HTTP/2 multiplexes concurrent
+    requests (and redirects) to the same host over one connection.
+    """
+    return httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        timeout=httpx.Timeout(settings.REQUEST_TIMEOUT),
+        follow_redirects=True,
+        transport=create_http_transport(),
+    )
@@ -1,8 +1,25 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 import os
 from app.config import settings
 
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers traceback formatting. The stock handler formats
+    the message and any exc_info traceback in the calling thread; here only
+    the message is rendered (cheap, and it snapshots mutable args before the
+    caller can change them) while the traceback is formatted by the listener
+    thread.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
 def setup_logging():
     """Configure logging for the application"""
     
@@ -26,8 +43,14 @@ def setup_logging():
     console_handler.setFormatter(formatter)
     
     # Add handler to logger
+    # Records are queued and written by a listener thread, so formatting
+    # (including exc_info tracebacks) and stdout I/O stay off the event loop
     if not logger.handlers:
-        logger.addHandler(console_handler)
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(_DeferredQueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, console_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
         
     # Configure root logger as well
     logging.getLogger().setLevel(log_level)
@@ -0,0 +1,207 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlparse
+from app.core import logging
+
+logger = logging.logger
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI-style reset durations ("20ms", "1s", "6m0s") into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to retry-after-ms / retry-after (seconds or HTTP date)."""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, headers: Mapping[str, str]) -> float:
+    """
+    Exponential backoff with jitter (2**attempt + U(0, 1) seconds), shortened
+    to the server's Retry-After when that is sooner.
+    """
+    delay = 2 ** attempt + random.random()
+    retry_after = parse_retry_after(headers)
+    return min(retry_after, delay) if retry_after is not None else delay
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+class RateLimitTracker:
+    """
+    Tracks the provider's x-ratelimit-* response headers and delays new
+    requests once the remaining request or token quota drops below
+    `threshold` of the limit, instead of finding out through a 429.
+    """
+
+    def __init__(self, threshold: float = 0.1):
+        self.threshold = threshold
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.reset_at = 0.0  # time.monotonic() deadline
+        self._throttled = False
+
+    def update(self, headers: Mapping[str, str]) -> bool:
+        """
+        Record the quota reported by a response. Returns True when this
+        response moved the tracker into the throttled state.
+        """
+        limit_requests = _int_header(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _int_header(headers, "x-ratelimit-limit-tokens")
+        self.remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+        self.remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+
+        low_requests = (
+            limit_requests and self.remaining_requests is not None
+            and self.remaining_requests <= limit_requests * self.threshold
+        )
+        low_tokens = (
+            limit_tokens and self.remaining_tokens is not None
+            and self.remaining_tokens <= limit_tokens * self.threshold
+        )
+
+        wait = 0.0
+        if low_requests:
+            wait = max(wait, parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0)
+        if low_tokens:
+            wait = max(wait, parse_duration(headers.get("x-ratelimit-reset-tokens")) or 1.0)
+        return self._set_throttle(wait)
+
+    def block(self, headers: Mapping[str, str]) -> bool:
+        """Record a 429: honor Retry-After before sending anything else."""
+        return self._set_throttle(parse_retry_after(headers) or 1.0)
+
+    def _set_throttle(self, wait: float) -> bool:
+        was_throttled = self._throttled
+        if wait > 0:
+            self.reset_at = max(self.reset_at, time.monotonic() + wait)
+        self._throttled = self.reset_at > time.monotonic()
+        if self._throttled and not was_throttled:
+            logger.info("LLM rate limit nearly exhausted, delaying requests for %.2fs", wait)
+        return self._throttled and not was_throttled
+
+    async def wait_if_throttled(self):
+        delay = self.reset_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._throttled = False
+
+
+class SlidingWindow:
+    """
+    Proactive requests-per-period / tokens-per-period limiter for providers
+    that send no rate-limit headers (Ollama). A limit of 0 disables it.
+    """
+
+    def __init__(self, rpm: int, tpm: int = 0, period: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.period = period
+        self.req_times = deque()
+        self.tok_times = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = asyncio.Lock()
+
+    def _evict(self, now: float):
+        cutoff = now - self.period
+        while self.req_times and self.req_times[0] <= cutoff:
+            self.req_times.popleft()
+        while self.tok_times and self.tok_times[0][0] <= cutoff:
+            self._tokens_in_window -= self.tok_times.popleft()[1]
+
+    def idle(self, now: float) -> bool:
+        """True when nothing is waiting and every recorded request has aged out."""
+        last = max(
+            self.req_times[-1] if self.req_times else 0.0,
+            self.tok_times[-1][0] if self.tok_times else 0.0,
+        )
+        return not self._lock.locked() and last <= now - self.period
+
+    async def acquire(self, tokens_est: int = 0):
+        """Wait until one more request of ~`tokens_est` tokens fits in the window."""
+        if self.tpm:
+            # A single oversized request must still be admitted eventually
+            tokens_est = min(tokens_est, self.tpm)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._evict(now)
+                wait = 0.0
+                if self.rpm and len(self.req_times) >= self.rpm:
+                    wait = self.req_times[0] + self.period - now
+                if self.tpm and self.tok_times and self._tokens_in_window + tokens_est > self.tpm:
+                    wait = max(wait, self.tok_times[0][0] + self.period - now)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            self.req_times.append(now)
+            if tokens_est:
+                self.tok_times.append((now, tokens_est))
+                self._tokens_in_window += tokens_est
+
+
+class HostRateLimiter:
+    """
+    One SlidingWindow per host (netloc): at most `rate` requests per
+    `period` seconds to any single site. A rate of 0 disables it. Windows of
+    hosts not contacted for a whole period are dropped, at most once per
+    period, so visiting arbitrary hosts does not grow the table forever.
+    """
+
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._windows: Dict[str, SlidingWindow] = {}
+        self._next_sweep = 0.0
+
+    def _sweep(self, now: float):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.period
+        for host in [h for h, window in self._windows.items() if window.idle(now)]:
+            del self._windows[host]
+
+    async def acquire(self, url: str):
+        if not self.rate:
+            return
+        self._sweep(time.monotonic())
+        host = urlparse(url).netloc.lower()
+        window = self._windows.get(host)
+        if window is None:
+            window = self._windows[host] = SlidingWindow(rpm=self.rate, period=self.period)
+        await window.acquire()
@@ -1,21 +1,56 @@
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import ORJSONResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from app.config import settings
 from app.core import logging
+from app.services.cache_service import cache_service
+from app.services.openai_service import openai_service
+from app.services.scraper_service import scraper_service
+from app.services.search_service import search_service
 # from app.api.v1.router import api_router  # Will import later
 
 logger = logging.logger
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown."""
+    logger.info("Application starting up...")
+    logger.info("Event loop: %s", type(asyncio.get_running_loop()).__module__)
+    # Independent: open the HTTP pool and page cache while Redis connects
+    _, app.state.redis = await asyncio.gather(scraper_service.startup(), cache_service.connect())
+    app.state.http = scraper_service.client
+    search_service.set_client(app.state.http)
+    # Runs in the background so startup is not held up by slow hosts
+    warm_up = asyncio.create_task(scraper_service.warm_up(settings.WARMUP_HOSTS))
+
+    yield
+
+    logger.info("Application shutting down...")
+    # Settle the warm-up before its client is closed
+    warm_up.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await warm_up
+    await asyncio.gather(
+        openai_service.shutdown(),
+        scraper_service.shutdown(),
+        cache_service.close(),
+        return_exceptions=True,
+    )
+
 def create_application() -> FastAPI:
     application = FastAPI(
         title=settings.PROJECT_NAME,
         version=settings.VERSION,
         openapi_url="/openapi.json",
         docs_url="/docs",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan,
     )
 
     # Set up Rate Limiter
@@ -32,16 +67,6 @@ def create_application() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # Event Handlers
-    @application.on_event("startup")
-    async def startup_event():
-        logger.info("Application starting up...")
-        # Initialize resources here (Redis, etc.)
-
-    @application.on_event("shutdown")
-    async def shutdown_event():
-        logger.info("Application shutting down...")
-
     # Include Router
     from app.api.v1.router import api_router
     application.include_router(api_router, prefix=settings.API_V1_STR)
@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, HttpUrl, Field
+from pydantic import BaseModel, ConfigDict, HttpUrl, Field
 from datetime import datetime
 
 # --- Shared Models ---
@@ -35,7 +35,7 @@ class EnrichedProductData(BaseModel):
 
 class EnrichmentRequest(BaseModel):
     """Request from main PIMS system"""
-    model_config = {"extra": "ignore"}  # Ignore extra fields
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True, frozen=True)  # Ignore extra fields
     
     product_name: str = Field(..., min_length=1, max_length=500, description="Product name")
     category: Optional[str] = Field(None, description="Product category (helps search)")
@@ -57,7 +57,7 @@ class EnrichmentResponse(BaseModel):
 
 class BatchEnrichmentRequest(BaseModel):
     """Request to enrich multiple products in one call"""
-    model_config = {"extra": "ignore"}
+    model_config = ConfigDict(extra="ignore", frozen=True)
 
     products: List[EnrichmentRequest] = Field(
         ...,
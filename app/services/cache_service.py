@@ -0,0 +1,129 @@
+import hashlib
+import os
+from collections import Counter
+from typing import List, Optional
+import orjson
+import zstandard as zstd
+from redis.asyncio import Redis
+from app.config import settings
+from app.core import logging
+from app.models.schemas import EnrichmentRequest
+
+logger = logging.logger
+
+# One-byte format tag prepended to every stored value
+_FORMAT_ZSTD = b"\x01"       # zstd, no dictionary
+_FORMAT_ZSTD_DICT = b"\x02"  # zstd with the shared dictionary (CACHE_ZSTD_DICT_PATH)
+
+# Redis is best-effort: an unreachable host must fail fast, not stall requests
+_REDIS_TIMEOUT_SECONDS = 1.0
+
+def train_zstd_dictionary(samples: List[bytes], path: str, dict_size: int = 16 * 1024):
+    """
+    Train a shared zstd dictionary from sample payloads (~100 serialized
+    EnrichmentResponse JSONs) and write it to `path` for CACHE_ZSTD_DICT_PATH.
+    """
+    dictionary = zstd.train_dictionary(dict_size, samples)
+    with open(path, "wb") as f:
+        f.write(dictionary.as_bytes())
+
+class CacheService:
+    def __init__(self):
+        self.enabled = settings.CACHE_ENABLED
+        self.ttl_seconds = settings.CACHE_TTL_DAYS * 86400
+        self.redis: Optional[Redis] = None
+        # Per key namespace ("enrich", "llm"), so response and LLM caches are reported separately
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+        dictionary = None
+        dict_path = settings.CACHE_ZSTD_DICT_PATH
+        if dict_path and os.path.exists(dict_path):
+            with open(dict_path, "rb") as f:
+                dictionary = zstd.ZstdCompressionDict(f.read())
+        elif dict_path:
+            logger.warning("zstd dictionary %s not found, compressing cache entries without it", dict_path)
+        self._format = _FORMAT_ZSTD_DICT if dictionary else _FORMAT_ZSTD
+        self._cctx = zstd.ZstdCompressor(level=3, dict_data=dictionary)
+        self._dctx = zstd.ZstdDecompressor()
+        self._dctx_dict = zstd.ZstdDecompressor(dict_data=dictionary) if dictionary else None
+
+    async def connect(self) -> Optional[Redis]:
+        """
+        Create the Redis client. Called once on application startup.
+        """
+        if not self.enabled:
+            logger.info("Response cache disabled (CACHE_ENABLED=false)")
+            return None
+        self.redis = Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=_REDIS_TIMEOUT_SECONDS,
+            socket_timeout=_REDIS_TIMEOUT_SECONDS,
+        )
+        try:
+            await self.redis.ping()
+        except Exception as e:
+            logger.warning("Redis not reachable at startup, requests will run uncached until it is: %s", e)
+        return self.redis
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    def make_key(self, request: EnrichmentRequest) -> str:
+        """
+        Stable cache key for a normalized enrichment request.
+        """
+        payload = orjson.dumps(request.model_dump(exclude_none=True), option=orjson.OPT_SORT_KEYS)
+        return "enrich:" + hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(key)
+        except Exception as e:
+            # Cache is best-effort: a Redis outage must not fail enrichment
+            logger.warning("Cache lookup failed for %s: %s", key, e)
+            return None
+
+        if raw is not None:
+            try:
+                raw = self._decode(raw)
+            except Exception as e:
+                logger.warning("Discarding undecodable cache entry %s: %s", key, e)
+                raw = None
+
+        kind = key.partition(":")[0]
+        if raw is None:
+            self.misses[kind] += 1
+            logger.info("Cache miss for %s (hits=%s, misses=%s)", key, self.hits[kind], self.misses[kind])
+        else:
+            self.hits[kind] += 1
+            logger.info("Cache hit for %s (hits=%s, misses=%s)", key, self.hits[kind], self.misses[kind])
+        return raw
+
+    async def set(self, key: str, value: str):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, self._format + self._cctx.compress(value.encode()), ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning("Cache store failed for %s: %s", key, e)
+
+    def _decode(self, raw: bytes) -> bytes:
+        """Decompress a stored value back to its JSON bytes."""
+        tag, body = raw[:1], raw[1:]
+        if tag == _FORMAT_ZSTD:
+            return self._dctx.decompress(body)
+        if tag == _FORMAT_ZSTD_DICT:
+            if self._dctx_dict is None:
+                raise ValueError("entry was compressed with a zstd dictionary that is not loaded")
+            return self._dctx_dict.decompress(body)
+        if tag == b"{":
+            # Uncompressed JSON written before compression was introduced
+            return raw
+        raise ValueError(f"unknown cache format tag {tag!r}")
+
+cache_service = CacheService()
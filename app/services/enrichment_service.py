@@ -1,66 +1,78 @@
 import asyncio
 import time
-from typing import List, Optional
-from app.models.schemas import EnrichmentRequest, EnrichmentResponse, EnrichedProductData, SourceReference
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.config import settings
+from app.core.admission import admission_controller
+from app.models.schemas import (
+    EnrichmentRequest,
+    EnrichmentResponse,
+    EnrichedProductData,
+    ProductContent,
+    SearchResult,
+    SourceReference,
+)
 from app.services.search_service import search_service
 from app.services.scraper_service import scraper_service
 from app.services.openai_service import openai_service
+from app.services.cache_service import cache_service
 from app.core import logging
+from app.utils.text import content_digest
+from app.utils.url import canonicalize_url
 
 logger = logging.logger
 
+# Number of scraped pages used per product
+SCRAPE_TOP_N = 3
+
 class EnrichmentService:
-    async def enrich_product(self, request: EnrichmentRequest) -> EnrichmentResponse:
+    def __init__(self):
+        # Pipelines currently running, keyed by cache key (single-flight)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get_cached_json(self, request: EnrichmentRequest) -> Optional[bytes]:
+        """
+        Return the cached response for `request` as serialized JSON (already
+        marked cached=True), or None on a miss.
+        """
+        return await cache_service.get(cache_service.make_key(request))
+
+    async def enrich_product(self, request: EnrichmentRequest, check_cache: bool = True) -> EnrichmentResponse:
+        """
+        Enrich a product, coalescing concurrent identical requests so that only
+        one pipeline runs and the other callers await its result.
+        Pass check_cache=False when the caller has already looked the request up.
+        """
+        cache_key = cache_service.make_key(request)
+        task = self._inflight.get(cache_key)
+        if task is not None:
+            logger.info("Joining in-flight enrichment for: %s", request.product_name)
+            result = await asyncio.shield(task)
+            return result.model_copy()
+
+        # The pipeline runs in its own task so a caller going away (client
+        # disconnect, batch timeout) never cancels it for the others
+        task = asyncio.create_task(self._enrich(request, cache_key, check_cache))
+        self._inflight[cache_key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(cache_key, None))
+        # Retrieve the exception so it is not reported when every caller left
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    async def _enrich(self, request: EnrichmentRequest, cache_key: str, check_cache: bool = True) -> EnrichmentResponse:
         start_time = time.time()
-        logger.info(f"Starting enrichment for: {request.product_name}")
+        logger.info("Starting enrichment for: %s", request.product_name)
         
+        # 0. Serve identical requests from cache
+        raw = await cache_service.get(cache_key) if check_cache else None
+        if raw is not None:
+            try:
+                return EnrichmentResponse.model_validate_json(raw)
+            except Exception as e:
+                logger.warning("Discarding unreadable cache entry %s: %s", cache_key, e)
+
         try:
-            # 1. Search Query construction
-            from app.config import settings
-            
-            search_results = []
-            valid_content = []
-            sources = []
-            
-            # Check if search is enabled
-            if settings.SEARCH_PROVIDER and settings.SEARCH_PROVIDER.lower() != "none":
-                query = f"{request.product_name}"
-                if request.brand:
-                    query += f" {request.brand}"
-                if request.model:
-                    query += f" {request.model}"
-                
-                # 2. Perform Web Search
-                logger.info(f"Calling search_service.search with query: '{query}'")
-                
-                search_results = await search_service.search(query)
-                
-                logger.info(f"Search returned {len(search_results) if search_results else 0} results")
-                
-                if search_results:
-                    # 3. Scrape Top Results (e.g., top 3-4 deep scrape)
-                    # Use asyncio.gather for parallel scraping
-                    scrape_tasks = []
-                    sources = []
-                    
-                    # Filter results to avoid generic pages if possible (e.g. Amazon listing vs generic search page)
-                    # For now, just take top 3 results
-                    results_to_scrape = search_results[:3]
-                    
-                    for result in results_to_scrape:
-                        scrape_tasks.append(scraper_service.extract_content(result.url))
-                        sources.append(SourceReference(url=result.url, title=result.title, relevance_score=1.0 - (result.position * 0.1)))
-        
-                    scraped_content = await asyncio.gather(*scrape_tasks, return_exceptions=True)
-                    
-                    # Filter failed scrapes
-                    valid_content = [c for c in scraped_content if c and not isinstance(c, Exception)]
-                else:
-                    logger.warning("Search returned no results, proceeding to LLM generation only")
-                    sources = []
-            else:
-                logger.info("Search provider not configured, skipping search and using LLM generation only")
-                sources = []
+            search_results, sources, valid_content = await self._collect_sources(request)
 
             # 4. Synthesize with LLM
             enriched_data = await openai_service.synthesize_product_data(
@@ -70,20 +82,10 @@ class EnrichmentService:
             )
             
             # 5. Construct Response
-            processing_time = time.time() - start_time
-            logger.info(f"Enrichment completed in {processing_time:.2f}s")
-            return EnrichmentResponse(
-                success=True,
-                product_name=request.product_name,
-                enriched_data=enriched_data,
-                sources=sources,
-                search_results_count=len(search_results),
-                processing_time=processing_time,
-                cached=False
-            )
+            return await self._finish(request, cache_key, enriched_data, sources, search_results, start_time)
 
         except Exception as e:
-            logger.error(f"Enrichment process failed: {str(e)}", exc_info=True)
+            logger.error("Enrichment process failed: %s", e, exc_info=True)
             return EnrichmentResponse(
                 success=False,
                 product_name=request.product_name,
@@ -91,4 +93,298 @@ class EnrichmentService:
                 processing_time=time.time() - start_time
             )
 
+    async def enrich_products_bulk(self, requests: List[EnrichmentRequest]) -> List[EnrichmentResponse]:
+        """
+        Enrich many products, synthesizing up to BATCH_LLM_GROUP_SIZE products
+        of the same category with a single LLM call. Results are returned in
+        input order; failures come back as success=False responses.
+        """
+        results: List[Optional[EnrichmentResponse]] = [None] * len(requests)
+        keys = [cache_service.make_key(r) for r in requests]
+
+        raws = await asyncio.gather(*(cache_service.get(k) for k in keys))
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for i, raw in enumerate(raws):
+            if raw is not None:
+                try:
+                    results[i] = EnrichmentResponse.model_validate_json(raw)
+                    continue
+                except Exception as e:
+                    logger.warning("Discarding unreadable cache entry %s: %s", keys[i], e)
+            groups[(requests[i].category or "").strip().lower()].append(i)
+
+        group_size = max(1, settings.BATCH_LLM_GROUP_SIZE)
+        chunks = [
+            idxs[j:j + group_size]
+            for idxs in groups.values()
+            for j in range(0, len(idxs), group_size)
+        ]
+        chunk_results = await asyncio.gather(
+            *(self._enrich_group([requests[i] for i in chunk], [keys[i] for i in chunk]) for chunk in chunks)
+        )
+        for chunk, responses in zip(chunks, chunk_results):
+            for i, response in zip(chunk, responses):
+                results[i] = response
+        return results
+
+    async def _enrich_group(self, requests: List[EnrichmentRequest], keys: List[str]) -> List[EnrichmentResponse]:
+        """Search and scrape each product, then synthesize the group in one LLM call when it fits."""
+        async with admission_controller.slot():
+            start_time = time.time()
+            collected = await self._collect_sources_many(requests)
+
+            ok = [i for i, item in enumerate(collected) if not isinstance(item, Exception)]
+            enriched: List = [None] * len(requests)
+
+            # LLM response cache first: only misses go to the model
+            response_cache = openai_service.response_cache
+            lookups = await asyncio.gather(*(
+                response_cache.lookup(requests[i].product_name, requests[i].additional_context, collected[i][2])
+                for i in ok
+            ))
+            misses = []
+            for i, (cached, key, embedding) in zip(ok, lookups):
+                if cached is not None:
+                    enriched[i] = cached
+                else:
+                    misses.append((i, key, embedding))
+
+            # Bulk prompts share one context budget; products with rich
+            # scraped content are better served alone.
+            source_tokens = sum(openai_service.source_tokens(collected[i][2]) for i, _, _ in misses)
+            use_bulk = len(misses) > 1 and source_tokens <= openai_service.bulk_token_limit
+            if use_bulk:
+                try:
+                    data = await openai_service.synthesize_products_bulk(
+                        [(requests[i].product_name, collected[i][2], requests[i].additional_context) for i, _, _ in misses]
+                    )
+                    for (i, key, embedding), d in zip(misses, data):
+                        enriched[i] = d
+                    await asyncio.gather(*(
+                        response_cache.store(key, embedding, d) for (_, key, embedding), d in zip(misses, data)
+                    ))
+                except Exception as e:
+                    logger.warning("Bulk synthesis failed, falling back to per-product calls: %s", e)
+                    use_bulk = False
+
+            if not use_bulk:
+                pending = [i for i, d in enumerate(enriched) if d is None]
+                singles = await asyncio.gather(
+                    *(self._synthesize(requests[i], collected[i]) for i in pending),
+                    return_exceptions=True,
+                )
+                for i, d in zip(pending, singles):
+                    enriched[i] = d
+
+            responses = []
+            for r, key, item, data in zip(requests, keys, collected, enriched):
+                error = item if isinstance(item, Exception) else data if isinstance(data, Exception) else None
+                if error is not None:
+                    logger.error("Enrichment process failed for %s: %s", r.product_name, error, exc_info=error)
+                    responses.append(EnrichmentResponse(
+                        success=False,
+                        product_name=r.product_name,
+                        error=f"Internal processing error: {str(error)}",
+                        processing_time=time.time() - start_time
+                    ))
+                else:
+                    search_results, sources, _ = item
+                    responses.append(await self._finish(r, key, data, sources, search_results, start_time))
+
+            admission_controller.record(time.time() - start_time, ok=all(resp.success for resp in responses))
+            return responses
+
+    async def _synthesize(self, request: EnrichmentRequest, collected) -> EnrichedProductData:
+        """Single-product synthesis for one `_collect_sources` result (or its error)."""
+        if isinstance(collected, Exception):
+            raise collected
+        # The group already decided against a shared call; don't let the
+        # micro-batcher merge these back together
+        return await openai_service.synthesize_product_data(
+            product_name=request.product_name,
+            search_results=collected[2],
+            context=request.additional_context,
+            coalesce=False,
+        )
+
+    async def _collect_sources(
+        self, request: EnrichmentRequest
+    ) -> Tuple[List[SearchResult], List[SourceReference], List[ProductContent]]:
+        """
+        Search for the product and scrape the top results.
+        Returns (search_results, sources, scraped_content); `sources` lists
+        only the pages whose content is actually used.
+        """
+        search_results = await self._search(request)
+        if not search_results:
+            return search_results, [], []
+
+        # 3. Scrape results concurrently, using whichever pages arrive first
+        used = await self._scrape_until_enough(search_results)
+        return (
+            search_results,
+            self._sources([r for r, _ in used]),
+            [content for _, content in used],
+        )
+
+    async def _scrape_until_enough(
+        self, search_results: List[SearchResult]
+    ) -> List[Tuple[SearchResult, ProductContent]]:
+        """
+        Scrape every search result concurrently and keep up to SCRAPE_TOP_N
+        pages, in search-rank order. Stop waiting once SCRAPE_TOP_N pages
+        have arrived, SCRAPE_MIN_SOURCES of them with at least
+        SCRAPE_MIN_CHARS of text, or SCRAPE_DEADLINE_SECONDS has passed;
+        remaining scrapes are cancelled so one slow site does not hold up
+        synthesis. Pages whose text repeats an earlier page are skipped.
+        """
+        tasks = [asyncio.create_task(scraper_service.extract_content(r.url)) for r in search_results]
+        pending = set(tasks)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.SCRAPE_DEADLINE_SECONDS
+        scraped = rich = 0
+        seen = set()
+        try:
+            while pending:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    logger.info("Scrape deadline reached, cancelling %s slow scrape(s)", len(pending))
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    content = None if task.exception() else task.result()
+                    digest = content_digest(content.text_content) if content else None
+                    if digest and digest not in seen:
+                        seen.add(digest)
+                        scraped += 1
+                        if len(content.text_content) >= settings.SCRAPE_MIN_CHARS:
+                            rich += 1
+                if pending and (scraped >= SCRAPE_TOP_N or rich >= settings.SCRAPE_MIN_SOURCES):
+                    logger.info("Enough content scraped, cancelling %s remaining scrape(s)", len(pending))
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        scraped_pages = (
+            (result, task.result())
+            for result, task in zip(search_results, tasks)
+            if not task.cancelled() and task.exception() is None
+        )
+        return self._unique_content(scraped_pages)[:SCRAPE_TOP_N]
+
+    async def _collect_sources_many(self, requests: List[EnrichmentRequest]) -> List:
+        """
+        `_collect_sources` for a whole group: all scrapes go out as one
+        `extract_many` batch. Per-product search failures are returned as
+        exceptions in place of the tuple.
+        """
+        searched = await asyncio.gather(*(self._search(r) for r in requests), return_exceptions=True)
+
+        urls = []
+        for results in searched:
+            if not isinstance(results, Exception):
+                urls.extend(r.url for r in results[:SCRAPE_TOP_N])
+        scraped = iter(await scraper_service.extract_many(urls))
+
+        collected = []
+        for results in searched:
+            if isinstance(results, Exception):
+                collected.append(results)
+                continue
+            used = self._unique_content(zip(results[:SCRAPE_TOP_N], scraped))
+            collected.append((results, self._sources([r for r, _ in used]), [content for _, content in used]))
+        return collected
+
+    async def _search(self, request: EnrichmentRequest) -> List[SearchResult]:
+        """Run the web search for `request` (empty when no provider is configured)."""
+        # Check if search is enabled
+        if not settings.SEARCH_PROVIDER or settings.SEARCH_PROVIDER.lower() == "none":
+            logger.info("Search provider not configured, skipping search and using LLM generation only")
+            return []
+
+        # 1. Search Query construction
+        query = f"{request.product_name}"
+        if request.brand:
+            query += f" {request.brand}"
+        if request.model:
+            query += f" {request.model}"
+
+        # 2. Perform Web Search
+        logger.info("Calling search_service.search with query: '%s'", query)
+        search_results = await search_service.search(query)
+        logger.info("Search returned %s results", len(search_results) if search_results else 0)
+        if not search_results:
+            logger.warning("Search returned no results, proceeding to LLM generation only")
+            return []
+        return self._unique_results(search_results)
+
+    @staticmethod
+    def _unique_results(results: List[SearchResult]) -> List[SearchResult]:
+        """Drop results whose canonical URL repeats a higher-ranked one."""
+        seen = set()
+        unique = []
+        for r in results:
+            url = canonicalize_url(r.url)
+            if url not in seen:
+                seen.add(url)
+                unique.append(r)
+        if len(unique) < len(results):
+            logger.info("Dropped %s duplicate search result URL(s)", len(results) - len(unique))
+        return unique
+
+    @staticmethod
+    def _unique_content(
+        pages: Iterable[Tuple[SearchResult, Optional[ProductContent]]]
+    ) -> List[Tuple[SearchResult, ProductContent]]:
+        """Successful pages in order, skipping any whose text repeats an earlier page."""
+        seen = set()
+        unique = []
+        for result, content in pages:
+            if not content:
+                continue
+            digest = content_digest(content.text_content)
+            if digest not in seen:
+                seen.add(digest)
+                unique.append((result, content))
+        return unique
+
+    @staticmethod
+    def _sources(results: List[SearchResult]) -> List[SourceReference]:
+        # Fields come from our own SearchResult, so skip re-validation
+        return [
+            SourceReference.model_construct(
+                url=r.url,
+                title=r.title,
+                relevance_score=max(0.0, 1.0 - r.position * 0.1),
+            )
+            for r in results
+        ]
+
+    async def _finish(
+        self,
+        request: EnrichmentRequest,
+        cache_key: str,
+        enriched_data: EnrichedProductData,
+        sources: List[SourceReference],
+        search_results: List[SearchResult],
+        start_time: float,
+    ) -> EnrichmentResponse:
+        """Build the success response and store it in the cache."""
+        processing_time = time.time() - start_time
+        logger.info("Enrichment completed in %.2fs", processing_time)
+        response = EnrichmentResponse(
+            success=True,
+            product_name=request.product_name,
+            enriched_data=enriched_data,
+            sources=sources,
+            search_results_count=len(search_results),
+            processing_time=processing_time,
+            cached=False
+        )
+        # Stored pre-marked as cached so hits can be returned byte-for-byte
+        await cache_service.set(cache_key, response.model_copy(update={"cached": True}).model_dump_json())
+        return response
+
 enrichment_service = EnrichmentService()
@@ -0,0 +1,122 @@
+import hashlib
+from typing import List, Optional, Tuple
+import orjson
+from openai import AsyncOpenAI
+from app.config import settings
+from app.core import logging
+from app.models.schemas import EnrichedProductData, ProductContent
+from app.services.cache_service import cache_service
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.logger
+
+class LLMResponseCache:
+    """
+    Two-tier cache for synthesized product data.
+
+    Exact tier: Redis entry keyed by SHA-256 of the model, product name,
+    context and the hashes of the source texts, so the same product over the
+    same corpus never reaches the LLM twice.
+
+    Semantic tier (opt-in, SEMANTIC_CACHE_ENABLED): an in-process matrix of
+    normalized embeddings of `product_name + context`; a query whose cosine
+    similarity to a stored row reaches SEMANTIC_CACHE_THRESHOLD reuses that
+    row's exact entry. The index is per process and starts empty on restart.
+    """
+
+    def __init__(self, client: AsyncOpenAI, model: str):
+        self.client = client
+        self.model = model
+        self.semantic = settings.SEMANTIC_CACHE_ENABLED
+        if self.semantic and np is None:
+            logger.warning("numpy not installed, semantic LLM cache disabled")
+            self.semantic = False
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = max(1, settings.SEMANTIC_CACHE_MAX_ENTRIES)
+        self._vectors = None  # (max_entries, dim) float32, rows are unit length
+        self._keys: List[Optional[str]] = [None] * self.max_entries
+        self._count = 0
+        self._next = 0  # Ring-buffer slot for the next row
+
+    def make_key(
+        self,
+        product_name: str,
+        context: Optional[str],
+        search_results: List[ProductContent],
+    ) -> str:
+        sources = sorted(
+            (r.url, hashlib.sha256(r.text_content.encode()).hexdigest()) for r in search_results
+        )
+        payload = orjson.dumps(
+            {"model": self.model, "product_name": product_name, "context": context, "sources": sources},
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return "llm:" + hashlib.sha256(payload).hexdigest()
+
+    async def lookup(
+        self,
+        product_name: str,
+        context: Optional[str],
+        search_results: List[ProductContent],
+    ) -> Tuple[Optional[EnrichedProductData], str, Optional["np.ndarray"]]:
+        """
+        Returns (cached data or None, exact key, query embedding or None);
+        pass the key and embedding back to `store` on a miss.
+        """
+        key = self.make_key(product_name, context, search_results)
+        data = await self._load(key)
+        if data is not None or not self.semantic:
+            return data, key, None
+
+        embedding = await self._embed(self._semantic_text(product_name, context))
+        if embedding is None or not self._count:
+            return None, key, embedding
+
+        similarities = self._vectors[:self._count] @ embedding
+        best = int(similarities.argmax())
+        if similarities[best] >= self.threshold:
+            logger.info("Semantic LLM cache hit for %s (similarity %.3f)", product_name, similarities[best])
+            data = await self._load(self._keys[best])
+        return data, key, embedding
+
+    async def store(self, key: str, embedding: Optional["np.ndarray"], data: EnrichedProductData):
+        await cache_service.set(key, data.model_dump_json())
+        if embedding is None:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+        self._vectors[self._next] = embedding
+        self._keys[self._next] = key
+        self._next = (self._next + 1) % self.max_entries
+        self._count = min(self._count + 1, self.max_entries)
+
+    async def _load(self, key: str) -> Optional[EnrichedProductData]:
+        raw = await cache_service.get(key)
+        if raw is None:
+            return None
+        try:
+            return EnrichedProductData.model_validate_json(raw)
+        except Exception as e:
+            logger.warning("Discarding unreadable LLM cache entry %s: %s", key, e)
+            return None
+
+    @staticmethod
+    def _semantic_text(product_name: str, context: Optional[str]) -> str:
+        return f"{product_name} {context}" if context else product_name
+
+    async def _embed(self, text: str) -> Optional["np.ndarray"]:
+        try:
+            response = await self.client.embeddings.create(model=settings.EMBEDDING_MODEL_NAME, input=text)
+        except Exception as e:
+            logger.warning("Embedding request failed, skipping semantic cache: %s", e)
+            return None
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        if self._vectors is not None and vector.shape[0] != self._vectors.shape[1]:
+            logger.warning("Embedding size changed (%s), skipping semantic cache", vector.shape[0])
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
@@ -1,13 +1,102 @@
-import json
 import asyncio
-from typing import List, Optional, Dict, Any
-from openai import AsyncOpenAI
+import time
+from typing import Final, List, Optional, Dict, Any, Tuple
+from openai import AsyncOpenAI, RateLimitError
+from pydantic import BaseModel, ValidationError
 from app.config import settings
 from app.core import logging
+from app.core.admission import admission_controller
+from app.core.rate_limit import RateLimitTracker, SlidingWindow
 from app.models.schemas import ProductContent, EnrichedProductData
+from app.services.llm_cache import LLMResponseCache
+from app.utils.text import CHARS_PER_TOKEN, count_tokens, dedupe_paragraphs, drop_near_duplicates, truncate_to_tokens
 
 logger = logging.logger
 
+# (product_name, search_results, context) for one product
+Product = Tuple[str, List[ProductContent], Optional[str]]
+
+_SYS_SOURCES: Final = """You are a precise Product Information Specialist. Your task is to extract and synthesize structured product data from the provided web search results.
+
+RULES:
+1. ONLY use information found in the provided sources. Do not hallucinate features.
+2. If information is missing (e.g., price), explicitly state it or leave it null.
+3. Output MUST be valid JSON matching the specified schema.
+4. Focus on technical specifications, key features, and marketing benefits.
+5. Create a SEO-optimized title and description based on the finding.
+"""
+
+_SYS_FALLBACK: Final = """You are a knowledgeable Product Information Specialist. Your task is to generate structured product data based on your internal knowledge.
+
+RULES:
+1. Provide accurate and factual information based on your training data.
+2. If the product is fictional or unknown, provide a best-effort realistic representation or state limitations in the description.
+3. Output MUST be valid JSON matching the specified schema.
+4. Focus on technical specifications, key features, and marketing benefits.
+5. Create a SEO-optimized title and description.
+"""
+
+_NO_SOURCES: Final = "No external search results available. Please generate data based on your internal knowledge."
+
+_SCHEMA: Final = """{
+    "detailed_description": "Comprehensive description...",
+    "features": ["feature 1", "feature 2"],
+    "specifications": {"spec_name": "value"},
+    "benefits": ["benefit 1", "benefit 2"],
+    "use_cases": ["use case 1", "use case 2"],
+    "images": ["url1", "url2"],
+    "price_range": "$X - $Y (or null)",
+    "category_hierarchy": ["Category", "Subcategory"],
+    "tags": ["tag1", "tag2"],
+    "seo_title": "SEO Title",
+    "seo_description": "SEO Description"
+}"""
+
+# Sent as the first user message, right after the system prompt: the
+# system + schema prefix is byte-identical across calls, so providers (and
+# Ollama's prompt cache) can reuse it instead of re-processing it each time.
+_SCHEMA_PROMPT: Final = "Respond with one JSON object in the following structure:\n" + _SCHEMA
+
+_USER_TEMPLATE: Final = """
+Product Name: {name}
+Additional Context: {context}
+
+Search Results:
+{sources}
+
+Please synthesize this information into the JSON structure given above.
+"""
+
+_BULK_SYS_SUFFIX: Final = """6. You will receive several numbered products. Treat each one independently and only use the sources listed under that product.
+"""
+
+_BULK_PRODUCT_TEMPLATE: Final = """
+=== Product {index} ===
+Product Name: {name}
+Additional Context: {context}
+
+Search Results:
+{sources}
+"""
+
+_BULK_SCHEMA_PROMPT: Final = (
+    'Respond with one JSON object of the form {"products": [<product 1>, <product 2>, ...]}, '
+    'where each entry has the following structure, with "index" set to the product\'s number:\n'
+    + _SCHEMA.replace("{", '{\n    "index": 1,', 1)
+)
+
+_BULK_USER_TEMPLATE: Final = """{products}
+Please synthesize this information for EVERY product above, in the same order, with exactly {count} entries in "products", each with "index" set to its product number.
+"""
+
+class _BulkProduct(EnrichedProductData):
+    """One entry of a multi-product completion, tagged with its product number."""
+    index: int
+
+class _BulkProducts(BaseModel):
+    """Shape of a multi-product completion."""
+    products: List[_BulkProduct]
+
 class OpenAIService:
     def __init__(self):
         self.client = AsyncOpenAI(
@@ -16,96 +105,390 @@ class OpenAIService:
         )
         self.model = settings.OPENAI_MODEL_NAME
         self.max_tokens = settings.MAX_TOKENS
+        self.rate_limits = RateLimitTracker()
+        self.window = SlidingWindow(rpm=settings.OLLAMA_RPM, tpm=settings.OLLAMA_TPM)
+        self.response_cache = LLMResponseCache(self.client, self.model)
+        self.batch_window = settings.MICROBATCH_WINDOW_MS / 1000.0
+        self.batch_max = max(1, settings.MICROBATCH_MAX_SIZE)
+        # (product, source tokens, future) per queued single-product call
+        self._queue: "asyncio.Queue[Tuple[Product, int, asyncio.Future]]" = asyncio.Queue()
+        self._batcher: Optional[asyncio.Task] = None
+        self._batches = set()  # Running batch tasks (kept referenced until done)
 
     async def synthesize_product_data(
         self,
         product_name: str,
         search_results: List[ProductContent],
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        coalesce: bool = True,
     ) -> EnrichedProductData:
         """
         Synthesize structured product data from search results using LLM.
+        Results are cached (see LLMResponseCache), and calls arriving within
+        MICROBATCH_WINDOW_MS of each other are coalesced into one
+        multi-product completion unless coalesce=False.
+        """
+        cached, key, embedding = await self.response_cache.lookup(product_name, context, search_results)
+        if cached is not None:
+            return cached
+        data = await self._synthesize_queued(product_name, search_results, context, coalesce)
+        await self.response_cache.store(key, embedding, data)
+        return data
+
+    async def shutdown(self):
+        """Stop the micro-batcher and any batches still running. Called on application shutdown."""
+        tasks = list(self._batches)
+        if self._batcher is not None:
+            tasks.append(self._batcher)
+            self._batcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Requests queued but not yet picked up by a batch
+        while not self._queue.empty():
+            _, _, fut = self._queue.get_nowait()
+            fut.cancel()
+
+    async def _synthesize_queued(
+        self,
+        product_name: str,
+        search_results: List[ProductContent],
+        context: Optional[str],
+        coalesce: bool,
+    ) -> EnrichedProductData:
+        if not coalesce or self.batch_window <= 0 or self.batch_max <= 1:
+            return await self._synthesize_single(product_name, search_results, context)
+        tokens = self.source_tokens(search_results)
+        if tokens > self.bulk_token_limit:
+            # Too big to share a prompt without cutting its sources
+            return await self._synthesize_single(product_name, search_results, context)
+
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.done() or self._batcher.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._run_batcher())
+        fut = loop.create_future()
+        await self._queue.put(((product_name, search_results, context), tokens, fut))
+        return await fut
+
+    @property
+    def bulk_token_limit(self) -> int:
+        """Most source tokens a multi-product prompt may carry in total."""
+        return self.max_tokens // 2
+
+    def source_tokens(self, search_results: List[ProductContent]) -> int:
+        return sum(count_tokens(c.text_content, self.model) for c in search_results)
+
+    async def _run_batcher(self):
+        """
+        Drain the queue: after the first item arrives, keep collecting for up
+        to MICROBATCH_WINDOW_MS (or MICROBATCH_MAX_SIZE items, or until the
+        sources would exceed bulk_token_limit), then send the batch off
+        without waiting for it so the next window can start.
         """
+        loop = asyncio.get_running_loop()
+        carry = None  # Item that did not fit the previous batch
+        try:
+            while True:
+                first = carry or await self._queue.get()
+                carry = None
+                batch = [first]
+                tokens = first[1]
+                deadline = loop.time() + self.batch_window
+                while len(batch) < self.batch_max:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if tokens + item[1] > self.bulk_token_limit:
+                        carry = item
+                        break
+                    batch.append(item)
+                    tokens += item[1]
+                # Callers that gave up while queued need no answer
+                batch = [(product, fut) for product, _, fut in batch if not fut.done()]
+                if batch:
+                    task = asyncio.create_task(self._run_batch(batch))
+                    self._batches.add(task)
+                    task.add_done_callback(self._batches.discard)
+        except asyncio.CancelledError:
+            if carry is not None:
+                carry[2].cancel()
+            raise
+
+    async def _run_batch(self, batch: List[Tuple[Product, asyncio.Future]]):
+        try:
+            if len(batch) == 1:
+                (product, _), = batch
+                results = [await self._synthesize_single(*product)]
+            else:
+                logger.info("Micro-batching %s LLM requests into one call", len(batch))
+                try:
+                    results = await self.synthesize_products_bulk([product for product, _ in batch])
+                except ValueError as e:
+                    # Unusable multi-product output (bad JSON, wrong count, schema
+                    # mismatch): answer each request on its own instead
+                    logger.warning("Micro-batch response unusable, retrying %s requests individually: %s", len(batch), e)
+                    results = await asyncio.gather(
+                        *(self._synthesize_single(*product) for product, _ in batch),
+                        return_exceptions=True,
+                    )
+        except asyncio.CancelledError:
+            # Shutting down: release the callers instead of leaving them waiting
+            for _, fut in batch:
+                fut.cancel()
+            raise
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    async def _synthesize_single(
+        self,
+        product_name: str,
+        search_results: List[ProductContent],
+        context: Optional[str] = None
+    ) -> EnrichedProductData:
         # Prepare context from search results
         context_text = ""
         if search_results:
-            for i, result in enumerate(search_results):
-                context_text += f"\n--- Source {i+1}: {result.url} ---\n"
-                context_text += f"Title: {result.title}\n"
-                context_text += f"Content: {result.text_content[:2000]}...\n" # Truncate to avoid context limit
-            
-            system_prompt = """You are a precise Product Information Specialist. Your task is to extract and synthesize structured product data from the provided web search results.
-            
-            RULES:
-            1. ONLY use information found in the provided sources. Do not hallucinate features.
-            2. If information is missing (e.g., price), explicitly state it or leave it null.
-            3. Output MUST be valid JSON matching the specified schema.
-            4. Focus on technical specifications, key features, and marketing benefits.
-            5. Create a SEO-optimized title and description based on the finding.
-            """
+            budget = self._source_budget(_SYS_SOURCES, _SCHEMA_PROMPT, _USER_TEMPLATE)
+            context_text = self._format_sources(search_results, budget)
+            system_prompt = _SYS_SOURCES
         else:
             # Fallback to pure generation if no search results provided
             logger.info("No search results provided. Using LLM internal knowledge for generation.")
-            system_prompt = """You are a knowledgeable Product Information Specialist. Your task is to generate structured product data based on your internal knowledge.
-            
-            RULES:
-            1. Provide accurate and factual information based on your training data.
-            2. If the product is fictional or unknown, provide a best-effort realistic representation or state limitations in the description.
-            3. Output MUST be valid JSON matching the specified schema.
-            4. Focus on technical specifications, key features, and marketing benefits.
-            5. Create a SEO-optimized title and description.
-            """
-
-        user_prompt = f"""
-        Product Name: {product_name}
-        Additional Context: {context if context else 'None'}
-        
-        Search Results:
-        {context_text if context_text else "No external search results available. Please generate data based on your internal knowledge."}
-        
-        Please synthesize this information into the following JSON structure:
-        {{
-            "detailed_description": "Comprehensive description...",
-            "features": ["feature 1", "feature 2"],
-            "specifications": {{"spec_name": "value"}},
-            "benefits": ["benefit 1", "benefit 2"],
-            "use_cases": ["use case 1", "use case 2"],
-            "images": ["url1", "url2"],
-            "price_range": "$X - $Y (or null)",
-            "category_hierarchy": ["Category", "Subcategory"],
-            "tags": ["tag1", "tag2"],
-            "seo_title": "SEO Title",
-            "seo_description": "SEO Description"
-        }}
+            system_prompt = _SYS_FALLBACK
+
+        user_prompt = _USER_TEMPLATE.format(
+            name=product_name,
+            context=context or "None",
+            sources=context_text or _NO_SOURCES,
+        )
+
+        try:
+            # Higher temp for generation, lower for extraction
+            content = await self._complete(
+                system_prompt, _SCHEMA_PROMPT, user_prompt, temperature=0.7 if not search_results else 0.3
+            )
+            # Parse and validate in one pass (pydantic-core, no intermediate dict)
+            # This ensures we return expected structure even if LLM missed some optional fields
+            return EnrichedProductData.model_validate_json(content)
+
+        except ValidationError as e:
+            # Covers malformed JSON as well as schema mismatches
+            logger.error("LLM response is not valid product JSON: %s", e)
+            raise
+        except Exception as e:
+            logger.error("OpenAI synthesis failed: %s", e)
+            raise
+
+    async def synthesize_products_bulk(self, products: List[Product]) -> List[EnrichedProductData]:
+        """
+        Synthesize several products with one completion. `products` holds
+        (product_name, search_results, context) tuples; results come back in
+        the same order. The shared system prompt and schema are sent once.
+        Products with and without sources need different system prompts, so
+        a mixed group is sent as two completions. Raises ValueError when the
+        output cannot be matched to the products one-to-one.
         """
+        sourced = [i for i, (_, results, _) in enumerate(products) if results]
+        if 0 < len(sourced) < len(products):
+            unsourced = [i for i in range(len(products)) if i not in sourced]
+            parts = await asyncio.gather(
+                *(self._synthesize_uniform([products[i] for i in idxs]) for idxs in (sourced, unsourced))
+            )
+            merged: List[Optional[EnrichedProductData]] = [None] * len(products)
+            for idxs, items in zip((sourced, unsourced), parts):
+                for i, item in zip(idxs, items):
+                    merged[i] = item
+            return merged
+        return await self._synthesize_uniform(products)
+
+    async def _synthesize_uniform(self, products: List[Product]) -> List[EnrichedProductData]:
+        """`synthesize_products_bulk` for products that all have sources, or all have none."""
+        if len(products) == 1:
+            return [await self._synthesize_single(*products[0])]
+        has_sources = any(results for _, results, _ in products)
+        system_prompt = (_SYS_SOURCES if has_sources else _SYS_FALLBACK) + _BULK_SYS_SUFFIX
+        # The whole group shares the budget a single product would get, split
+        # in proportion to each product's source size (callers keep the total
+        # within bulk_token_limit, so no product has to be cut)
+        budget = self._source_budget(
+            system_prompt, _BULK_SCHEMA_PROMPT, _BULK_USER_TEMPLATE, _BULK_PRODUCT_TEMPLATE * len(products)
+        )
+        needs = [self.source_tokens(results) for _, results, _ in products]
+        total_need = sum(needs) or 1
+        blocks = [
+            _BULK_PRODUCT_TEMPLATE.format(
+                index=i + 1,
+                name=name,
+                context=context or "None",
+                sources=self._format_sources(results, budget * need // total_need) if results else _NO_SOURCES,
+            )
+            for i, ((name, results, context), need) in enumerate(zip(products, needs))
+        ]
+        user_prompt = _BULK_USER_TEMPLATE.format(products="".join(blocks), count=len(products))
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self._complete(
+                system_prompt, _BULK_SCHEMA_PROMPT, user_prompt, temperature=0.3 if has_sources else 0.7
+            )
+            items = _BulkProducts.model_validate_json(content).products
+            # Match entries by their product number, never by position alone
+            indexes = sorted(item.index for item in items)
+            if indexes != list(range(1, len(products) + 1)):
+                raise ValueError(f"LLM returned product numbers {indexes}, expected 1..{len(products)}")
+            items.sort(key=lambda item: item.index)
+            return [EnrichedProductData.model_validate(item.model_dump(exclude={"index"})) for item in items]
+
+        except ValidationError as e:
+            logger.error("Bulk LLM response is not valid product JSON: %s", e)
+            raise
+        except Exception as e:
+            logger.error("OpenAI bulk synthesis failed: %s", e)
+            raise
+
+    def _source_budget(self, *prompt_parts: str) -> int:
+        """
+        Tokens left for source text once the fixed prompt parts and the
+        response reserve are taken out of MAX_TOKENS.
+        """
+        overhead = sum(count_tokens(part, self.model) for part in prompt_parts)
+        return max(0, self.max_tokens - settings.LLM_RESPONSE_RESERVE_TOKENS - overhead)
+
+    def _format_sources(self, search_results: List[ProductContent], budget: int) -> str:
+        """
+        Render sources for the prompt within a cumulative `budget` of tokens.
+        Near-duplicate pages and paragraphs repeated across pages are dropped
+        first; each remaining source gets an even share of what is left, so
+        short sources leave room for longer later ones.
+        """
+        # Near-duplicate pages (mirrors, syndicated copy) only waste prompt tokens
+        unique_results = drop_near_duplicates(search_results, key=lambda r: r.text_content)
+        if len(unique_results) < len(search_results):
+            logger.info("Dropped %s near-duplicate sources", len(search_results) - len(unique_results))
+
+        # Boilerplate (footers, banners) repeated across sources is sent once.
+        # Texts are pre-cut to twice their fair share so dedupe work stays bounded.
+        char_cap = 2 * CHARS_PER_TOKEN * budget // len(unique_results)
+        texts = dedupe_paragraphs([r.text_content[:char_cap] for r in unique_results])
+        # A source left with nothing new (its text repeats earlier ones) is dropped
+        pairs = [(result, text) for result, text in zip(unique_results, texts) if text.strip()]
+        if len(pairs) < len(unique_results):
+            logger.info("Dropped %s sources with no content beyond earlier ones", len(unique_results) - len(pairs))
+
+        remaining = budget
+        parts = []
+        for i, (result, text) in enumerate(pairs):
+            if remaining <= 0:
+                logger.info("Source token budget exhausted, skipping %s sources", len(pairs) - i)
+                break
+            content, n_tokens = truncate_to_tokens(text, remaining // (len(pairs) - i), self.model)
+            remaining -= n_tokens
+            parts.append(f"\n--- Source {i+1}: {result.url} ---\nTitle: {result.title}\nContent: {content}...\n")
+        logger.info("Sending %s source tokens from %s sources to LLM", budget - remaining, len(parts))
+        return "".join(parts)
+
+    async def _complete(self, system_prompt: str, schema_prompt: str, user_prompt: str, temperature: float) -> str:
+        """
+        Run one JSON-mode chat completion under the rate limiters and return its text.
+        The static system and schema prompts go first so the prompt prefix is cacheable.
+        """
+        await self.window.acquire(
+            (len(system_prompt) + len(schema_prompt) + len(user_prompt)) // CHARS_PER_TOKEN + self.max_tokens
+        )
+        await self.rate_limits.wait_if_throttled()
+        try:
+            raw_response = await self.client.chat.completions.with_raw_response.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": schema_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                temperature=0.7 if not search_results else 0.3, # Higher temp for generation, lower for extraction
-                response_format={"type": "json_object"}
+                temperature=temperature,
+                response_format={"type": "json_object"},
+                stream=True,
+                # Final chunk carries token usage, including cached prompt tokens
+                # (stream_options is not a typed argument in this client version)
+                extra_body={"stream_options": {"include_usage": True}},
             )
-            
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Empty response from LLM")
-                
-            data = json.loads(content)
-            
-            # Validate and clean data using Pydantic model
-            # This ensures we return expected structure even if LLM missed some optional fields
-            return EnrichedProductData(**data)
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM JSON response: {e}")
-            # Fallback or retry logic could go here
-            raise ValueError("LLM returned invalid JSON")
-        except Exception as e:
-            logger.error(f"OpenAI synthesis failed: {e}")
+        except RateLimitError as e:
+            # The client already retried; hold off further calls and shed concurrency
+            if self.rate_limits.block(e.response.headers):
+                admission_controller.backoff(e)
             raise
 
+        if self.rate_limits.update(raw_response.headers):
+            admission_controller.backoff()
+        content = await self._read_stream(raw_response.parse())
+        if not content:
+            raise ValueError("Empty response from LLM")
+        return content
+
+    async def _read_stream(self, stream) -> str:
+        """
+        Collect a streamed completion into one string, logging time to first token.
+        Fails fast, closing the stream, when the output cannot be the JSON
+        object we asked for: it does not open with "{" or it runs past the
+        size any valid answer fits in (e.g. a repetition loop).
+        """
+        started = time.monotonic()
+        first_token_at = None
+        parts = []
+        size = 0
+        max_chars = 2 * self.max_tokens * CHARS_PER_TOKEN
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    self._log_usage(getattr(chunk, "usage", None))
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        logger.info("LLM first token after %.2fs", first_token_at - started)
+                    if not size:
+                        head = delta.lstrip()
+                        if head and head[0] != "{":
+                            raise ValueError(f"LLM response is not a JSON object (starts with {head[:20]!r})")
+                        if not head:
+                            continue
+                    parts.append(delta)
+                    size += len(delta)
+                    if size > max_chars:
+                        raise ValueError(f"LLM response exceeded {max_chars} characters")
+        finally:
+            # Release the connection even if the stream is abandoned midway
+            await stream.response.aclose()
+        logger.info("LLM stream finished after %.2fs", time.monotonic() - started)
+        return "".join(parts)
+
+    @staticmethod
+    def _log_usage(usage):
+        """Log prompt token usage and how much of the prompt was served from the provider's cache."""
+        if not usage:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump()
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        logger.info(
+            "LLM usage: %s prompt tokens (%s cached), %s completion tokens",
+            usage.get("prompt_tokens"),
+            cached,
+            usage.get("completion_tokens"),
+        )
+
 openai_service = OpenAIService()
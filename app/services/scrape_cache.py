@@ -0,0 +1,94 @@
+import asyncio
+from typing import Dict, Mapping, Optional, Tuple
+import zstandard as zstd
+from app.core import logging
+from app.models.schemas import ProductContent
+
+try:
+    # Optional: SQLite-backed on-disk key/value store
+    import diskcache
+except ImportError:
+    diskcache = None
+
+logger = logging.logger
+
+# (ETag, Last-Modified, zstd-compressed ProductContent JSON)
+CachedPage = Tuple[Optional[str], Optional[str], bytes]
+
+class ScrapeCache:
+    """
+    On-disk cache of parsed pages keyed by URL and revalidated with
+    conditional GETs: a page that answers 304 Not Modified costs one
+    header-only round trip and no parse. Only responses carrying an ETag or
+    Last-Modified are stored, since nothing else can be revalidated.
+    """
+
+    def __init__(self, directory: Optional[str], ttl_seconds: int):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._cache = None
+        self._cctx = zstd.ZstdCompressor(level=3)
+        self._dctx = zstd.ZstdDecompressor()
+
+    def open(self):
+        """Open (creating if needed) the cache directory. Called on startup."""
+        if not self.directory or self._cache is not None:
+            return
+        if diskcache is None:
+            logger.warning("diskcache not installed, scrape cache disabled")
+            return
+        try:
+            self._cache = diskcache.Cache(self.directory)
+        except Exception as e:
+            logger.warning("Cannot open scrape cache at %s, scraping uncached: %s", self.directory, e)
+
+    def close(self):
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    async def lookup(self, url: str) -> Optional[CachedPage]:
+        if self._cache is None:
+            return None
+        try:
+            return await asyncio.to_thread(self._cache.get, url)
+        except Exception as e:
+            logger.warning("Scrape cache lookup failed for %s: %s", url, e)
+            return None
+
+    @staticmethod
+    def conditional_headers(page: CachedPage) -> Dict[str, str]:
+        etag, last_modified, _ = page
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def load(self, page: CachedPage) -> Optional[ProductContent]:
+        """The cached ProductContent, or None when the entry cannot be decoded."""
+        try:
+            return ProductContent.model_validate_json(self._dctx.decompress(page[2]))
+        except Exception as e:
+            logger.warning("Discarding undecodable scrape cache entry: %s", e)
+            return None
+
+    async def evict(self, url: str):
+        if self._cache is None:
+            return
+        try:
+            await asyncio.to_thread(self._cache.delete, url)
+        except Exception as e:
+            logger.warning("Scrape cache eviction failed for %s: %s", url, e)
+
+    async def store(self, url: str, headers: Mapping[str, str], content: ProductContent):
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if self._cache is None or not (etag or last_modified):
+            return
+        page = (etag, last_modified, self._cctx.compress(content.model_dump_json().encode()))
+        try:
+            await asyncio.to_thread(self._cache.set, url, page, expire=self.ttl_seconds)
+        except Exception as e:
+            logger.warning("Scrape cache store failed for %s: %s", url, e)
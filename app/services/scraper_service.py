@@ -1,76 +1,331 @@
+import asyncio
+import codecs
+from collections import Counter
+from contextlib import AsyncExitStack, asynccontextmanager
+from urllib.parse import urlparse
 import httpx
-from bs4 import BeautifulSoup, Comment
-from typing import Optional, List
+import orjson
+from selectolax.parser import HTMLParser
+from typing import Dict, Final, Optional, List, Union
+from app.config import settings
 from app.models.schemas import ProductContent
 from app.core import logging
+from app.core.http import BATCH_HEADERS, RETRY_STATUSES, create_http_client, host_rate_limiter
+from app.core.rate_limit import backoff_delay
+from app.services.scrape_cache import ScrapeCache
+
+try:
+    # Optional: runs batch fetches concurrently in a Rust (Tokio/reqwest) runtime
+    import rusty_req
+except ImportError:
+    rusty_req = None
+
+try:
+    # Optional: readability-style main-content extraction (drops nav, ads, related links)
+    import trafilatura
+except ImportError:
+    trafilatura = None
 
 logger = logging.logger
 
+# Boilerplate removed before text extraction (strip_tags only accepts a list)
+_STRIP_TAGS: Final = ["script", "style", "nav", "footer", "header", "aside", "iframe", "noscript"]
+_DESCRIPTION_SELECTORS: Final = ('meta[name="description"]', 'meta[property="og:description"]')
+_IMAGE_SELECTOR: Final = "img[src]"
+# Image URLs containing these are site chrome, not product shots
+_IMAGE_SKIP_WORDS: Final = ("logo", "icon")
+_MAX_IMAGES: Final = 5
+_MAX_TEXT_CHARS: Final = 15000
+
 class ScraperService:
     def __init__(self):
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+        # Sent by rusty_req; the shared httpx client has DEFAULT_HEADERS preset
+        self.headers = BATCH_HEADERS
         self.timeout = httpx.Timeout(10.0, connect=5.0)
+        self._client: Optional[httpx.AsyncClient] = None
+        # Bound total in-flight fetches and, separately, fetches per host
+        self._fetch_slots = asyncio.Semaphore(settings.SCRAPE_MAX_CONCURRENCY)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_users: Counter = Counter()  # Holders + waiters per host; its semaphore goes at zero
+        # One rusty-req batch at a time: it holds a slot per URL for its whole run
+        self._rusty_batch = asyncio.Lock()
+        self.page_cache = ScrapeCache(settings.SCRAPE_CACHE_DIR, settings.SCRAPE_CACHE_TTL_HOURS * 3600)
+
+    async def startup(self):
+        """
+        Open the long-lived connection pool and the page cache. Called once
+        on application startup; the search service shares the same client.
+        """
+        if self._client is None:
+            self._client = create_http_client()
+        self.page_cache.open()
+
+    async def warm_up(self, hosts: List[str]):
+        """
+        Open one pooled connection to each of `hosts` (a HEAD request), so a
+        fetch shortly after startup reuses it instead of connecting. Idle
+        connections close after the pool's keep-alive expiry (30 s), so this
+        only helps requests arriving soon after boot. Best-effort: failures
+        are logged and ignored.
+        """
+        if not hosts:
+            return
+
+        async def warm(host: str):
+            try:
+                await self.client.head(f"https://{host}/", timeout=self.timeout)
+                return True
+            except Exception as e:
+                logger.info("Warm-up of %s failed: %s", host, e)
+                return False
+
+        warmed = await asyncio.gather(*(warm(host) for host in hosts))
+        logger.info("Opened connections to %s/%s warm-up host(s)", sum(warmed), len(hosts))
+
+    async def shutdown(self):
+        self.page_cache.close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = create_http_client()
+        return self._client
 
     async def extract_content(self, url: str) -> Optional[ProductContent]:
         """
-        Fetch and extract relevant content from a URL.
+        Fetch and extract relevant content from a URL. A page in the page
+        cache is revalidated and, if unchanged (304), served without a parse.
         """
         try:
-            async with httpx.AsyncClient(headers=self.headers, timeout=self.timeout, follow_redirects=True) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                # Check content type
-                content_type = response.headers.get("content-type", "").lower()
-                if "text/html" not in content_type:
-                    logger.warning(f"Skipping non-HTML content from {url}: {content_type}")
-                    return None
+            cached = await self.page_cache.lookup(url)
+            # Decoded before asking: revalidating an entry we cannot use would lose the page
+            cached_content = self.page_cache.load(cached) if cached else None
+            if cached and cached_content is None:
+                await self.page_cache.evict(url)
+            headers = self.page_cache.conditional_headers(cached) if cached_content else None
+            for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+                async with self._slot(url):
+                    await host_rate_limiter.acquire(url)
+                    async with self.client.stream("GET", url, headers=headers, timeout=self.timeout) as response:
+                        status = response.status_code
+                        if status == 304 and cached_content:
+                            logger.debug("Not modified, using cached page for %s", url)
+                            return cached_content
+                        if status in RETRY_STATUSES and attempt < settings.HTTP_MAX_RETRIES:
+                            delay = backoff_delay(attempt, response.headers)
+                        else:
+                            response.raise_for_status()
 
-                return self._parse_html(url, response.text)
+                            # Check content type before downloading the body
+                            content_type = response.headers.get("content-type", "").lower()
+                            if "text/html" not in content_type:
+                                logger.warning("Skipping non-HTML content from %s: %s", url, content_type)
+                                return None
+
+                            html = await self._read_capped(url, response)
+                            response_headers = response.headers
+                            break
+                # Back off outside the fetch slots so other pages keep flowing
+                logger.info("Got HTTP %s from %s, retrying in %.1fs", status, url, delay)
+                await asyncio.sleep(delay)
+
+            # Main-content extraction is CPU-bound; keep it off the event loop
+            content = await asyncio.to_thread(self._parse_html, url, html)
+            await self.page_cache.store(url, response_headers, content)
+            return content
         except Exception as e:
-            logger.warning(f"Failed to scrape {url}: {str(e)}")
+            logger.warning("Failed to scrape %s: %s", url, e)
             return None
 
-    def _parse_html(self, url: str, html: str) -> ProductContent:
-        soup = BeautifulSoup(html, "html.parser")
-        
-        # Remove script and style elements
-        for element in soup(["script", "style", "nav", "footer", "header", "aside", "iframe", "noscript"]):
-            element.decompose()
-            
-        # Remove comments
-        for element in soup(text=lambda text: isinstance(text, Comment)):
-            element.extract()
+    async def _read_capped(self, url: str, response: httpx.Response) -> Union[str, bytes]:
+        """
+        Read at most SCRAPE_MAX_BYTES of the (decompressed) body and stop
+        there, closing the stream early; the title, description and first
+        15k characters of text sit well within that on real product pages.
+        """
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) >= settings.SCRAPE_MAX_BYTES:
+                logger.info("Truncated %s after %s bytes", url, len(body))
+                break
+        logger.debug("Fetched %s (content-encoding %s)", url, response.headers.get("content-encoding", "identity"))
+        body = body[:settings.SCRAPE_MAX_BYTES]
+        charset = response.charset_encoding
+        if charset and self._known_codec(charset):
+            # The header charset wins; without one (or with a label Python does
+            # not know, e.g. utf8mb4) the parser sniffs <meta> and content
+            return body.decode(charset, errors="replace")
+        return bytes(body)
+
+    @staticmethod
+    def _known_codec(label: str) -> bool:
+        try:
+            codecs.lookup(label)
+        except LookupError:
+            return False
+        return True
+
+    @asynccontextmanager
+    async def _slot(self, url: str):
+        """Hold one global and one per-host fetch slot for `url`."""
+        host = urlparse(url).netloc.lower()
+        host_slots = self._host_slots.get(host)
+        if host_slots is None:
+            host_slots = self._host_slots[host] = asyncio.Semaphore(settings.SCRAPE_PER_HOST_CONCURRENCY)
+        self._host_users[host] += 1
+        try:
+            # Per-host first, so requests queued behind a busy host do not hold global slots
+            async with host_slots, self._fetch_slots:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                # Nobody holds or waits on it: drop it so the table tracks only active hosts
+                del self._host_users[host]
+                del self._host_slots[host]
+
+    async def extract_many(self, urls: List[str]) -> List[Optional[ProductContent]]:
+        """
+        Fetch and extract several URLs at once (batch enrichment path).
+        Results are aligned with `urls`; failed pages are None.
+        """
+        if not urls:
+            return []
+        # rusty-req fires the whole batch at once, so only use it when that
+        # stays within the concurrency limits and no other batch holds slots
+        busiest_host = max(Counter(urlparse(u).netloc.lower() for u in urls).values())
+        if (
+            not settings.SCRAPE_RUSTY_REQ
+            or rusty_req is None
+            or len(urls) > settings.SCRAPE_MAX_CONCURRENCY
+            or busiest_host > settings.SCRAPE_PER_HOST_CONCURRENCY
+            or self._rusty_batch.locked()
+        ):
+            return list(await asyncio.gather(*(self.extract_content(u) for u in urls)))
+
+        async with self._rusty_batch:
+            responses = await self._fetch_rusty(urls)
+        if responses is None:
+            return list(await asyncio.gather(*(self.extract_content(u) for u in urls)))
+
+        pages: Dict[int, str] = {}
+        retry: List[int] = []  # Transient failures, refetched with backoff through httpx
+        for r in responses:
+            try:
+                i = int(r["meta"]["tag"])
+                url = urls[i]
+                if r.get("exception"):
+                    logger.info("Batch fetch of %s failed, retrying with httpx: %s", url, r["exception"])
+                    retry.append(i)
+                    continue
+                status = r.get("http_status", 0)
+                if status in RETRY_STATUSES:
+                    logger.info("Batch fetch of %s got HTTP %s, retrying with httpx", url, status)
+                    retry.append(i)
+                    continue
+                if not 200 <= status < 300:
+                    logger.warning("Failed to scrape %s: HTTP %s", url, status)
+                    continue
+                # Some rusty-req versions return the response as a JSON string
+                body = r["response"]
+                if isinstance(body, str):
+                    body = orjson.loads(body)
+                content_type = body.get("headers", {}).get("content-type", "").lower()
+                if "text/html" not in content_type:
+                    logger.warning("Skipping non-HTML content from %s: %s", url, content_type)
+                    continue
+                # rusty-req has already downloaded it all; cap what gets parsed
+                pages[i] = body.get("content", "")[:settings.SCRAPE_MAX_BYTES]
+            except Exception as e:
+                logger.warning("Failed to parse batch scrape result: %s", e)
+
+        parsed, retried = await asyncio.gather(
+            asyncio.gather(
+                *(asyncio.to_thread(self._parse_html, urls[i], html) for i, html in pages.items()),
+                return_exceptions=True,
+            ),
+            asyncio.gather(*(self.extract_content(urls[i]) for i in retry)),
+        )
+        results: List[Optional[ProductContent]] = [None] * len(urls)
+        for i, content in zip(pages, parsed):
+            if isinstance(content, Exception):
+                logger.warning("Failed to parse %s: %s", urls[i], content)
+            else:
+                results[i] = content
+        for i, content in zip(retry, retried):
+            results[i] = content
+        return results
+
+    async def _fetch_rusty(self, urls: List[str]) -> Optional[List[dict]]:
+        """
+        Fetch `urls` in one rusty-req batch while holding a global and a
+        per-host fetch slot for each of them, after the per-host rate limit.
+        Returns None when the batch itself fails.
+        """
+        items = [
+            rusty_req.RequestItem(url=u, method="GET", headers=self.headers, tag=str(i), timeout=self.timeout.read)
+            for i, u in enumerate(urls)
+        ]
+        async with AsyncExitStack() as slots:
+            for url in urls:
+                await slots.enter_async_context(self._slot(url))
+            await asyncio.gather(*(host_rate_limiter.acquire(u) for u in urls))
+            try:
+                return await rusty_req.fetch_requests(
+                    items,
+                    total_timeout=float(settings.REQUEST_TIMEOUT),
+                    mode=rusty_req.ConcurrencyMode.JOIN_ALL,
+                )
+            except Exception as e:
+                logger.warning("rusty-req batch fetch failed, falling back to httpx: %s", e)
+                return None
+
+    def _parse_html(self, url: str, html: Union[str, bytes]) -> ProductContent:
+        # Raw bytes let the parser detect the charset (headers, <meta>) natively
+        tree = HTMLParser(html)
+
+        # Remove script and style elements (comments never reach .text())
+        tree.strip_tags(_STRIP_TAGS)
 
         # Extract title
-        title = soup.title.string.strip() if soup.title else ""
+        title_node = tree.css_first("title")
+        title = title_node.text().strip() if title_node else ""
         if not title:
-            h1 = soup.find("h1")
-            title = h1.get_text().strip() if h1 else ""
+            h1 = tree.css_first("h1")
+            title = h1.text().strip() if h1 else ""
 
         # Extract meta description
         description = ""
-        meta_desc = soup.find("meta", attrs={"name": "description"}) or soup.find("meta", attrs={"property": "og:description"})
+        for selector in _DESCRIPTION_SELECTORS:
+            meta_desc = tree.css_first(selector)
+            if meta_desc:
+                break
         if meta_desc:
-            description = meta_desc.get("content", "").strip()
+            description = (meta_desc.attributes.get("content") or "").strip()
+
+        # Extract main text content: the page body when trafilatura finds one,
+        # otherwise all remaining text
+        # (fed the stripped tree: scripts and styles are most of a page's bytes)
+        text_content = self._main_text(tree.html)
+        if not text_content:
+            text = tree.root.text(separator="\n", strip=True) if tree.root else ""
+            # Whitespace-only nodes come back as empty lines
+            text_content = "\n".join(line for line in text.split("\n") if line)
 
-        # Extract main text content
-        # Heuristic: Find container with most text properties
-        # Simple fallback: Get all text
-        text_content = soup.get_text(separator="\n", strip=True)
-        
         # Limit text length to avoid token limits (approx 2000 words)
-        text_content = text_content[:15000]
+        text_content = text_content[:_MAX_TEXT_CHARS]
 
         # Extract images (simple heuristic)
         images = []
-        for img in soup.find_all("img", src=True):
-            src = img["src"]
-            if src.startswith("http") and ("logo" not in src.lower()) and ("icon" not in src.lower()):
+        for img in tree.css(_IMAGE_SELECTOR):
+            src = img.attributes.get("src") or ""
+            if src.startswith("http") and not any(word in src.lower() for word in _IMAGE_SKIP_WORDS):
                 images.append(src)
-                if len(images) >= 5:
+                if len(images) >= _MAX_IMAGES:
                     break
 
         return ProductContent(
@@ -81,4 +336,19 @@ class ScraperService:
             images=images
         )
 
+    @staticmethod
+    def _main_text(html: Optional[str]) -> Optional[str]:
+        """
+        Main content of the page via trafilatura, or None when it is not
+        installed or finds no body. Tables are kept: on product pages they
+        usually hold the specifications.
+        """
+        if trafilatura is None or not html:
+            return None
+        try:
+            return trafilatura.extract(html, include_comments=False, include_tables=True, favor_precision=True)
+        except Exception as e:
+            logger.debug("Main-content extraction failed: %s", e)
+            return None
+
 scraper_service = ScraperService()
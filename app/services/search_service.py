@@ -1,22 +1,55 @@
 import asyncio
-from typing import List, Optional
-from duckduckgo_search import DDGS
+import urllib.parse
+from functools import lru_cache
+from typing import Dict, Final, List, Optional
+import httpx
+from selectolax.parser import HTMLParser
 from app.config import settings
 from app.core import logging
+from app.core.http import DEFAULT_HEADERS, RETRY_STATUSES, create_http_client, host_rate_limiter, rotated_headers
+from app.core.rate_limit import backoff_delay
 from app.models.schemas import SearchResult
 
 logger = logging.logger
 
+# DDG HTML structure: div.result -> h2.result__title -> a.result__a
+_DDG_RESULT_SELECTOR: Final = ".result"
+_DDG_TITLE_SELECTOR: Final = ".result__title a"
+_DDG_SNIPPET_SELECTOR: Final = ".result__snippet"
+
+# Text of DDG's bot-check page, served instead of results when rate limited
+_DDG_CHALLENGE_MARKERS: Final = ("unusual traffic", "anomaly-modal")
+
+@lru_cache(maxsize=4096)
+def _quote(query: str) -> str:
+    """URL-quoted search query; popular products are searched repeatedly."""
+    return urllib.parse.quote(query)
+
+def _is_ddg_challenge(html: str) -> bool:
+    head = html[:20000].lower()
+    return any(marker in head for marker in _DDG_CHALLENGE_MARKERS)
+
 class SearchService:
     def __init__(self):
         self.provider = settings.SEARCH_PROVIDER.lower() if settings.SEARCH_PROVIDER else "none"
         self.max_results = settings.MAX_SEARCH_RESULTS
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def set_client(self, client: httpx.AsyncClient):
+        """Use the application's shared HTTP client (set on startup)."""
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = create_http_client()
+        return self._client
 
     async def search(self, query: str) -> List[SearchResult]:
         """
         Search for a query using the configured provider.
         """
-        logger.info(f"Searching for '{query}' using {self.provider}")
+        logger.info("Searching for '%s' using %s", query, self.provider)
         
         try:
             if self.provider == "duckduckgo":
@@ -27,112 +60,82 @@ class SearchService:
                 return await self._search_googlesearch(query)
             else:
                 # Default fallback
-                logger.warning(f"Unknown search provider '{self.provider}', falling back to Google Search (python)")
+                logger.warning("Unknown search provider '%s', falling back to Google Search (python)", self.provider)
                 return await self._search_googlesearch(query)
         except Exception as e:
-            logger.error(f"Search failed: {str(e)}", exc_info=True)
+            logger.error("Search failed: %s", e, exc_info=True)
             return []
 
     async def _search_duckduckgo(self, query: str) -> List[SearchResult]:
         """
-        Search using DuckDuckGo (HTML Scraper enforced)
-        """
-        # The library is unstable/broken in this environment.
-        # Force fallback to HTML scraping which we verified works.
-        return await self._search_duckduckgo_html_fallback(query)
-
-    async def _search_duckduckgo_lib(self, query: str) -> List[SearchResult]:
-        """
-        Search using DuckDuckGo (Library - deprecated/backup)
+        Search using DuckDuckGo (HTML endpoint, scraped directly with the shared async client)
         """
         results = []
         try:
-            # DDGS is synchronous, so run in executor
-            loop = asyncio.get_event_loop()
-            ddgs = DDGS()
-            # Run the synchronous generator in a thread pool
-            ddg_results = await loop.run_in_executor(None, lambda: list(ddgs.text(query, max_results=self.max_results)))
+            # Use html.duckduckgo.com for simpler HTML scraping
+            url = f"https://html.duckduckgo.com/html/?q={_quote(query)}"
+            logger.info("DDG Scraper: Requesting %s", url)
             
-            for idx, r in enumerate(ddg_results):
-                results.append(SearchResult(
-                    title=r.get('title', ''),
-                    url=r.get('href', ''),
-                    snippet=r.get('body', ''),
-                    source="duckduckgo",
-                    position=idx + 1
-                ))
+            # None sends the client's default headers without a per-request merge
+            headers: Optional[Dict[str, str]] = None
+            for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+                await host_rate_limiter.acquire(url)
+                response = await self.client.get(url, headers=headers, timeout=30.0)
+                logger.info("DDG Scraper: Response Status %s", response.status_code)
+
+                # DDG answers bursts with 429/503 or a 202 "unusual traffic" challenge page
+                blocked = response.status_code == 202 or _is_ddg_challenge(response.text)
+                if not (blocked or response.status_code in RETRY_STATUSES) or attempt == settings.HTTP_MAX_RETRIES:
+                    break
+                delay = backoff_delay(attempt, response.headers)
+                if blocked:
+                    headers = rotated_headers(headers or DEFAULT_HEADERS)
+                logger.warning("DDG search throttled (status %s), retrying in %.1fs", response.status_code, delay)
+                await asyncio.sleep(delay)
+
+            if response.status_code != 200 or _is_ddg_challenge(response.text):
+                logger.error("DDG search failed with status %s", response.status_code)
+                return []
+            
+            results = self._parse_duckduckgo_html(response.text)
+            logger.info("DDG Scraper: Returning %s results", len(results))
         except Exception as e:
-            logger.error(f"DuckDuckGo search error: {e}")
+            logger.error("DuckDuckGo search error: %s", e, exc_info=True)
             
         return results
 
-    async def _search_duckduckgo_html_fallback(self, query: str) -> List[SearchResult]:
-        """
-        Fallback: Scrape DuckDuckGo HTML directly (Synchronous implementation run in thread pool)
-        """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: self._search_duckduckgo_html_sync(query))
-
-    def _search_duckduckgo_html_sync(self, query: str) -> List[SearchResult]:
-        import httpx
-        from bs4 import BeautifulSoup
-        import urllib.parse
-        
+    def _parse_duckduckgo_html(self, html: str) -> List[SearchResult]:
         results = []
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            # Use html.duckduckgo.com for simpler HTML scraping
-            url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
-            logger.info(f"DDG Scraper: Requesting {url}")
-            
-            # Use synchronous client with timeout
-            with httpx.Client(headers=headers, follow_redirects=True, timeout=30.0) as client:
-                response = client.get(url)
-                logger.info(f"DDG Scraper: Response Status {response.status_code}")
-                
-                if response.status_code != 200:
-                    logger.error(f"DDG fallback failed with status {response.status_code}")
-                    return []
-                
-                soup = BeautifulSoup(response.text, "html.parser")
-                results_elems = soup.select(".result")
-                logger.info(f"DDG Scraper: Found {len(results_elems)} result elements")
+        results_elems = HTMLParser(html).css(_DDG_RESULT_SELECTOR)
+        logger.info("DDG Scraper: Found %s result elements", len(results_elems))
+        
+        # Parse results
+        for idx, result in enumerate(results_elems):
+            if idx >= self.max_results:
+                break
                 
-                # Parse results
-                # DDG HTML structure: div.result -> h2.result__title -> a.result__a
-                for idx, result in enumerate(results_elems):
-                    if idx >= self.max_results:
-                        break
-                        
-                    title_elem = result.select_one(".result__title a")
-                    snippet_elem = result.select_one(".result__snippet")
-                    
-                    if title_elem:
-                        # logical_url is often better than href which might be a redirect
-                        link = title_elem.get('href', '')
-                        # Simple decoding if needed, but often clean in HTML version
-                        if "duckduckgo.com/l/?uddg=" in link:
-                            try:
-                                link = urllib.parse.unquote(link.split('uddg=')[1].split('&')[0])
-                            except:
-                                pass
-
-                        results.append(SearchResult(
-                            title=title_elem.get_text(strip=True),
-                            url=link,
-                            snippet=snippet_elem.get_text(strip=True) if snippet_elem else "",
-                            source="duckduckgo_html",
-                            position=idx + 1
-                        ))
-                        
-            logger.info(f"DDG Scraper: Returning {len(results)} results")
-        except Exception as e:
-            logger.error(f"DuckDuckGo fallback search error: {e}", exc_info=True)
+            title_elem = result.css_first(_DDG_TITLE_SELECTOR)
+            snippet_elem = result.css_first(_DDG_SNIPPET_SELECTOR)
             
+            if title_elem:
+                results.append(SearchResult(
+                    title=title_elem.text(separator=" ", strip=True),
+                    url=self._decode_ddg_link(title_elem.attributes.get("href") or ""),
+                    snippet=snippet_elem.text(separator=" ", strip=True) if snippet_elem else "",
+                    source="duckduckgo_html",
+                    position=idx + 1
+                ))
+                
         return results
 
+    @staticmethod
+    def _decode_ddg_link(link: str) -> str:
+        """Unwrap DDG redirect links (//duckduckgo.com/l/?uddg=<target>&rut=...)."""
+        if "duckduckgo.com/l/" not in link:
+            return link
+        target = urllib.parse.parse_qs(urllib.parse.urlsplit(link).query).get("uddg")
+        return target[0] if target else link
+
     async def _search_googlesearch(self, query: str) -> List[SearchResult]:
         """
         Search using googlesearch-python library
@@ -158,7 +161,7 @@ class SearchService:
                     position=idx + 1
                 ))
         except Exception as e:
-             logger.error(f"Google search error: {e}")
+             logger.error("Google search error: %s", e)
 
         return results
 
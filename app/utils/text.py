@@ -0,0 +1,174 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Callable, List, Sequence, Tuple, TypeVar
+from app.core import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.logger
+
+T = TypeVar("T")
+
+# Rough chars-per-token ratio for English text, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"\w+")
+
+# MinHash permutations h -> (a*h + b) mod p over 31-bit shingle hashes;
+# products stay below 2**62 so uint64 arithmetic cannot overflow
+_MINHASH_PRIME = (1 << 31) - 1
+_MINHASH_PERMS = 128
+if np is not None:
+    _rng = np.random.default_rng(0x5EED)
+    _MINHASH_A = _rng.integers(1, _MINHASH_PRIME, size=(_MINHASH_PERMS, 1), dtype=np.uint64)
+    _MINHASH_B = _rng.integers(0, _MINHASH_PRIME, size=(_MINHASH_PERMS, 1), dtype=np.uint64)
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+    """
+    Return a tiktoken encoding for `model`, or None if tiktoken (or its BPE
+    files) is unavailable. Local models like llama3 have no tiktoken mapping,
+    so cl100k_base is used as a generic BPE approximation.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken not installed, estimating tokens from character count")
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # BPE files are downloaded on first use; offline hosts fall back to estimates
+        logger.warning("Could not load tiktoken encoding, estimating tokens from character count: %s", e)
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    enc = get_encoding(model)
+    if enc is None:
+        return len(text) // CHARS_PER_TOKEN
+    return len(enc.encode(text))
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> Tuple[str, int]:
+    """
+    Cut `text` to at most `max_tokens` tokens.
+    Returns the truncated text and its token count.
+    """
+    if max_tokens <= 0:
+        return "", 0
+    enc = get_encoding(model)
+    if enc is None:
+        truncated = text[:max_tokens * CHARS_PER_TOKEN]
+        return truncated, len(truncated) // CHARS_PER_TOKEN
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return enc.decode(tokens[:max_tokens]), max_tokens
+
+def content_digest(text: str) -> bytes:
+    """128-bit BLAKE2b digest of `text`, for exact-duplicate detection."""
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+def _shingles(text: str, shingle_size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < shingle_size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash over word shingles of `text`."""
+    weights = [0] * 64
+    for shingle in _shingles(text, shingle_size):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def drop_near_duplicates(
+    items: Sequence[T],
+    key: Callable[[T], str],
+    max_distance: int = 8,
+    prefix_chars: int = 512,
+) -> List[T]:
+    """
+    Keep items in order, dropping any whose SimHash (over the first
+    `prefix_chars` of `key(item)`) is within `max_distance` bits of one
+    already kept.
+    """
+    kept: List[T] = []
+    fingerprints: List[int] = []
+    for item in items:
+        fp = simhash(key(item)[:prefix_chars])
+        if any(bin(fp ^ other).count("1") < max_distance for other in fingerprints):
+            continue
+        kept.append(item)
+        fingerprints.append(fp)
+    return kept
+
+def minhash(text: str, shingle_size: int = 3) -> "np.ndarray":
+    """128-permutation MinHash signature over word shingles of `text` (requires numpy)."""
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "big") & _MINHASH_PRIME
+            for shingle in _shingles(text, shingle_size)
+        ),
+        dtype=np.uint64,
+    )
+    return ((_MINHASH_A * hashes + _MINHASH_B) % _MINHASH_PRIME).min(axis=1)
+
+def dedupe_paragraphs(texts: Sequence[str], threshold: float = 0.8, min_words: int = 8) -> List[str]:
+    """
+    Drop paragraphs (lines) of at least `min_words` words whose estimated
+    Jaccard similarity to such a paragraph of an earlier text is at least
+    `threshold`, so boilerplate shared across sources (footers, cookie
+    banners) is only sent once. Repeats within one text and shorter lines
+    (table cells, "Wi-Fi" / "Yes" spec rows) are always kept. Without numpy
+    only exact repeats are dropped.
+    """
+    paragraphs = [text.split("\n") for text in texts]
+    seen = set()
+    signatures = None
+    if np is not None:
+        signatures = np.empty((sum(map(len, paragraphs)), _MINHASH_PERMS), dtype=np.uint64)
+    n_signatures = 0
+    min_equal = int(threshold * _MINHASH_PERMS + 0.5)
+
+    result = []
+    for lines in paragraphs:
+        kept = []
+        # Registered once the whole text is done: only earlier texts count
+        new_normalized = []
+        new_signatures = []
+        for paragraph in lines:
+            words = _WORD_RE.findall(paragraph.lower())
+            if len(words) < min_words:
+                kept.append(paragraph)
+                continue
+            normalized = " ".join(words)
+            if normalized in seen:
+                continue
+            if signatures is not None:
+                signature = minhash(normalized)
+                if n_signatures and (signatures[:n_signatures] == signature).sum(axis=1).max() >= min_equal:
+                    continue
+                new_signatures.append(signature)
+            new_normalized.append(normalized)
+            kept.append(paragraph)
+        seen.update(new_normalized)
+        for signature in new_signatures:
+            signatures[n_signatures] = signature
+            n_signatures += 1
+        result.append("\n".join(kept))
+    return result
@@ -0,0 +1,30 @@
+from functools import lru_cache
+from typing import Final
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track the click and never change the page
+_TRACKING_PARAMS: Final = frozenset({"gclid", "fbclid", "msclkid", "ref", "ref_"})
+_DEFAULT_PORTS: Final = {"http": 80, "https": 443}
+
+@lru_cache(maxsize=4096)
+def canonicalize_url(url: str) -> str:
+    """
+    Normalized form of `url` for deduplication: lower-cased scheme and host,
+    default port and fragment dropped, utm_* and other tracking parameters
+    removed, remaining query parameters sorted. Not meant to be fetched.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if port and port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
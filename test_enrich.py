@@ -1,16 +1,49 @@
-import requests
-import json
+import asyncio
+import statistics
+import sys
+import time
+import httpx
 
 url = "http://localhost:8000/api/v1/products/enrich"
-data = {
-    "product_name": "iPhone 15 Pro",
-    "brand": "Apple"
-}
+PRODUCTS = [
+    "iPhone 15 Pro",
+    "iPhone 15",
+    "iPhone 14 Pro",
+    "AirPods Pro 2",
+    "MacBook Air M3",
+    "iPad Air",
+    "Apple Watch Series 9",
+    "Magic Keyboard",
+]
 
-try:
-    response = requests.post(url, json=data, timeout=60)
-    print(f"Status Code: {response.status_code}")
-    print(f"Response:")
-    print(json.dumps(response.json(), indent=2))
-except Exception as e:
-    print(f"Error: {e}")
+async def hit(client: httpx.AsyncClient, i: int):
+    data = {"product_name": PRODUCTS[i % len(PRODUCTS)], "brand": "Apple"}
+    start = time.perf_counter()
+    try:
+        response = await client.post(url, json=data, timeout=60)
+        return response.status_code, time.perf_counter() - start, response.headers.get("x-cache")
+    except Exception as e:
+        print(f"Request {i} failed: {e}")
+        return None, time.perf_counter() - start, None
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def main(K: int):
+    async with httpx.AsyncClient() as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(hit(client, i) for i in range(K)))
+        wall = time.perf_counter() - start
+
+    for i, (status, elapsed, cache) in enumerate(results):
+        print(f"{i:3d} {PRODUCTS[i % len(PRODUCTS)]:<24} status={status} cache={cache} {elapsed:.2f}s")
+
+    latencies = [elapsed for status, elapsed, _ in results if status == 200]
+    print(f"\n{len(latencies)}/{K} succeeded in {wall:.2f}s wall time")
+    if latencies:
+        print(f"p50: {statistics.median(latencies):.2f}s  p95: {percentile(latencies, 95):.2f}s  max: {max(latencies):.2f}s")
+
+if __name__ == "__main__":
+    # Concurrent requests to fire: python test_enrich.py [K]
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else len(PRODUCTS)))